@@ -0,0 +1,131 @@
+"""Generate large synthetic pages for the step benchmarks.
+
+Every page ends with the same fixture: the links, text, form fields, alerts
+and frames the benchmarked steps look for. It's placed after the filler so
+that lookups have to get past the whole page to find it.
+"""
+
+import io
+import os.path
+
+
+FIXTURE = u"""
+<h1 id="heading">Benchmark fixture</h1>
+<p id="target">Needle in the haystack</p>
+<p id="hidden" style="display: none">Hidden needle</p>
+<a id="link" href="#destination">Benchmark link</a>
+<span id="tooltipped" title="Benchmark tooltip"
+      onclick="this.setAttribute('data-clicked', 'yes')">Tooltip</span>
+<form id="fixture-form" action="#submitted">
+  <label for="fixture-name">Fixture name</label>
+  <input id="fixture-name" name="fixture-name" type="text">
+  <input id="fixture-date" name="fixture-date" type="date">
+  <label><input id="fixture-agree" name="fixture-agree" type="checkbox">
+    Agree</label>
+  <input id="fixture-red" name="fixture-color" type="radio" value="red">
+  <input id="fixture-blue" name="fixture-color" type="radio" value="blue">
+  <select id="fixture-single" name="fixture-single">
+    {single_options}
+  </select>
+  <select id="fixture-multi" name="fixture-multi" multiple>
+    {multi_options}
+  </select>
+  <input id="fixture-submit" type="submit" value="Fixture submit">
+  <button id="fixture-button" type="button">Fixture button</button>
+</form>
+<iframe id="fixture-frame" srcdoc="<p>Inside the frame</p>"></iframe>
+"""
+
+# Nodes in each block of filler: div > (h2, p > (span, a), ul > li * 3).
+FILLER_BLOCK_NODES = 10
+
+FILLER_BLOCK = u"""
+<div class="block block-{i}">
+  <h2>Section {i}</h2>
+  <p><span>Filler text {i}</span> <a href="#block-{i}">filler link {i}</a></p>
+  <ul><li>Item {i}.1</li><li>Item {i}.2</li><li>Item {i}.3</li></ul>
+</div>"""
+
+FORM_FIELD = u"""
+<div class="field">
+  <label for="field-{i}">Field {i}</label>
+  <input id="field-{i}" name="field-{i}" type="text" value="value {i}">
+  <input id="check-{i}" name="check-{i}" type="checkbox">
+  <input type="submit" name="submit-{i}" value="Submit {i}">
+</div>"""
+
+
+def page(title, body, options=100):
+    return u"""<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>{title}</title></head>
+<body>
+{body}
+{fixture}
+</body>
+</html>
+""".format(
+        title=title,
+        body=body,
+        fixture=FIXTURE.format(
+            single_options=option_list(options),
+            multi_options=option_list(options),
+        ),
+    )
+
+
+def option_list(count):
+    return u''.join(
+        u'<option value="option-{i}">Option {i}</option>'.format(i=i)
+        for i in range(count)
+    )
+
+
+def dom_page(nodes):
+    """A page of roughly 'nodes' elements of ordinary content."""
+    return page(
+        u'{} nodes'.format(nodes),
+        u''.join(FILLER_BLOCK.format(i=i)
+                 for i in range(nodes // FILLER_BLOCK_NODES)),
+    )
+
+
+def form_page(fields):
+    """A page with a form of 'fields' labelled fields ahead of the fixture."""
+    return page(
+        u'{} fields'.format(fields),
+        u'<form id="big-form" action="#big">{}</form>'.format(
+            u''.join(FORM_FIELD.format(i=i) for i in range(fields))),
+        options=fields,
+    )
+
+
+def deep_page(depth):
+    """A page whose filler is nested 'depth' elements deep."""
+    return page(
+        u'{} deep'.format(depth),
+        u'{}<span>Deepest filler</span>{}'.format(
+            u'<div class="level">' * depth, u'</div>' * depth),
+    )
+
+
+PAGES = (
+    ('dom-1k', dom_page, 1000),
+    ('dom-10k', dom_page, 10000),
+    ('dom-100k', dom_page, 100000),
+    ('form-300', form_page, 300),
+    ('deep-500', deep_page, 500),
+)
+
+
+def write_pages(directory, names=None):
+    """Write the benchmark pages to 'directory' and return their URLs."""
+    urls = {}
+    for name, generate, size in PAGES:
+        if names and name not in names:
+            continue
+        path = os.path.abspath(os.path.join(directory, name + '.html'))
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(generate(size))
+        urls[name] = 'file://' + path
+    return urls
@@ -0,0 +1,390 @@
+"""Benchmark the steps against large synthetic pages.
+
+Run every step in planterbox_webdriver.webdriver and
+planterbox_webdriver.css_selector_steps against each generated page in a
+headless browser, recording each step's latency and the number of WebDriver
+commands it sends:
+
+    python benchmarks/run.py run
+
+Results are saved as .benchmarks/<commit>.json. Compare two runs with
+
+    python benchmarks/run.py compare <base commit> <commit>
+
+which prints a table of the changes and exits with status 1 if any step got
+slower by more than --threshold or started sending more commands.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from selenium.common.exceptions import (  # noqa: E402
+    NoAlertPresentException,
+    WebDriverException,
+)
+from selenium.webdriver.common.alert import Alert  # noqa: E402
+
+from planterbox_webdriver import css_selector_steps, webdriver  # noqa: E402
+from planterbox_webdriver.factory import DriverFactory  # noqa: E402
+from planterbox_webdriver.monkeypatch import fix_inequality  # noqa: E402
+from planterbox_webdriver.profiling import CommandProfiler  # noqa: E402
+
+from pages import PAGES, write_pages  # noqa: E402
+
+
+DEFAULT_RESULTS = '.benchmarks'
+
+ALERT_SETUP = ("window.setTimeout(function() {"
+               " alert('Benchmark alert'); }, 0);")
+
+
+def case(sentence, setup=None, pages=None):
+    """
+    A step to benchmark, with a script to prepare the page before each run
+    and, optionally, the only pages to run it on.
+    """
+    return {'step': sentence, 'setup': setup, 'pages': pages}
+
+
+CASES = [
+    # webdriver.py
+    case('I visit "benchmark"'),
+    case('I click "Benchmark link"'),
+    case('I should see a link with the url "#destination"'),
+    case('I should see a link to "Benchmark link" with the url '
+         '"#destination"'),
+    case('I should see a link that contains the text "Benchmark" and the url '
+         '"#destination"'),
+    case('The element with id of "target" contains "Needle"'),
+    case('The element with id of "target" does not contain "Missing"'),
+    case('I should see an element with id of "target" within 1 second'),
+    case('I should see an element with id of "target"'),
+    case('I should not see an element with id of "hidden"'),
+    case('I should see "Needle in the haystack" within 1 second'),
+    case('I should see "Needle in the haystack"'),
+    case('I see "Needle in the haystack"'),
+    case('I should not see "Hidden needle"'),
+    case('I should be at "benchmark"'),
+    case('The browser\'s URL should contain ".html"'),
+    case('The browser\'s URL should not contain "missing"'),
+    case('I should see a form that goes to "#submitted"'),
+    case('I fill in "Fixture name" with "Benchmark"'),
+    case('I set "Fixture name" to "Benchmark"'),
+    case('I type "Benchmark" into "Fixture name"'),
+    case('I press "Fixture button"'),
+    case('I click on label "Fixture name"'),
+    case('Element with id "fixture-name" should be focused',
+         setup="document.getElementById('fixture-name').focus();"),
+    case('Element with id "fixture-name" should not be focused'),
+    case('Input "Fixture name" has value "Benchmark"',
+         setup="document.getElementById('fixture-name').value = "
+               "'Benchmark';"),
+    case('I submit the only form', pages=['dom-1k', 'dom-10k', 'dom-100k',
+                                          'deep-500']),
+    case('I submit the form with id "fixture-form"'),
+    case('I submit the form with action "#submitted"'),
+    case('I check "fixture-agree"'),
+    case('I uncheck "fixture-agree"',
+         setup="document.getElementById('fixture-agree').checked = true;"),
+    case('The "fixture-agree" checkbox should be checked',
+         setup="document.getElementById('fixture-agree').checked = true;"),
+    case('The "fixture-agree" checkbox should not be checked'),
+    case('I select "Option 42" from "fixture-single"'),
+    case('I select the following from "fixture-multi":\n'
+         '    Option 1\n    Option 42\n    Option 99'),
+    case('The "Option 0" option from "fixture-single" should be selected'),
+    case('The following options from "fixture-multi" should be selected:\n'
+         '    Option 1\n    Option 42',
+         setup="var options = document.getElementById('fixture-multi')"
+               ".options; options[1].selected = true;"
+               " options[42].selected = true;"),
+    case('I should see option "Option 42" in selector "fixture-single"'),
+    case('I should not see option "Missing" in selector "fixture-single"'),
+    case('I choose "fixture-red"'),
+    case('The "fixture-red" option should be chosen',
+         setup="document.getElementById('fixture-red').checked = true;"),
+    case('The "fixture-red" option should not be chosen'),
+    case('I accept the alert', setup=ALERT_SETUP),
+    case('I dismiss the alert', setup=ALERT_SETUP),
+    case('I should see an alert with text "Benchmark alert"',
+         setup=ALERT_SETUP),
+    case('I should not see an alert'),
+    case('I should see an element with tooltip "Benchmark tooltip"'),
+    case('I should not see an element with tooltip "Missing tooltip"'),
+    case('I click the element with tooltip "Benchmark tooltip"'),
+    case('The page title should be "Benchmark"',
+         setup="document.title = 'Benchmark';"),
+    case('I wait for the page to be idle'),
+    case('The page should be idle within 1 second'),
+    case('I switch to the frame with id "fixture-frame"'),
+    case('I switch back to the main view'),
+
+    # css_selector_steps.py
+    case('There should be an element matching $("#target")'),
+    case('There should be an element matching '
+         '$("p:contains(Needle in the haystack)")'),
+    case('There should be an element matching $("#target") within 1 second'),
+    case('There should be exactly 1 elements matching $("#fixture-form")'),
+    case('I fill in $("#fixture-name") with "Benchmark"'),
+    case('I set $("#fixture-name") to "Benchmark"'),
+    case('I type "Benchmark" into $("#fixture-name")'),
+    case('I submit $("#fixture-form")'),
+    case('I check $("#fixture-agree")'),
+    case('I click $("#fixture-button")'),
+    case('I follow the link $("#link")'),
+    case('$("#fixture-single option:first") should be selected'),
+    case('I select $("#fixture-single option:eq(3)")'),
+    case('There should not be an element matching $("#missing")'),
+]
+
+
+class BenchmarkTest(unittest.TestCase):
+    """Stands in for a feature's test case when calling steps directly."""
+
+    config = None
+
+    def __init__(self, browser, pages):
+        super(BenchmarkTest, self).__init__()
+        self.browser = browser
+        self.PAGES = pages
+
+    def runTest(self):
+        pass
+
+
+def step_inventory():
+    steps = []
+    for module in (webdriver, css_selector_steps):
+        for name in sorted(dir(module)):
+            maybe_step = getattr(module, name)
+            if hasattr(maybe_step, 'planterbox_patterns') and \
+                    maybe_step not in steps:
+                steps.append(maybe_step)
+    return steps
+
+
+def match_step(steps, sentence):
+    """Find a step's function and arguments, as planterbox would."""
+    sentence = 'When ' + sentence
+    for step_fn in steps:
+        for pattern in step_fn.planterbox_patterns:
+            match = pattern.match(sentence)
+            if match is not None:
+                return step_fn, match.groups()
+    raise ValueError('No step matches {!r}'.format(sentence))
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def make_browser(name):
+    return DriverFactory(browser=name, headless=True)()
+
+
+def clean_up(browser):
+    try:
+        Alert(browser).dismiss()
+    except (NoAlertPresentException, WebDriverException):
+        pass
+    browser.switch_to.default_content()
+
+
+def run_case(test, profiler, steps, url, sentence, setup, repeat):
+    step_fn, arguments = match_step(steps, sentence)
+    timings = []
+    commands = []
+    for _ in range(repeat):
+        test.browser.get(url)
+        if setup:
+            test.browser.execute_script(setup)
+            time.sleep(0.1)
+        profiler.start_step(url, None, sentence, step_fn.__name__)
+        started = time.time()
+        try:
+            step_fn(test, *arguments)
+        except Exception as e:
+            profiler.stop_step()
+            clean_up(test.browser)
+            return {'error': '{}: {}'.format(type(e).__name__, e)}
+        timings.append(time.time() - started)
+        commands.append(profiler.stop_step()['commands'])
+        clean_up(test.browser)
+    return {
+        'median': median(timings),
+        'min': min(timings),
+        'commands': median(commands),
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD']).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args):
+    steps = step_inventory()
+    covered = set(match_step(steps, c['step'])[0] for c in CASES)
+    for step_fn in steps:
+        if step_fn not in covered:
+            print('warning: no benchmark for {}'.format(step_fn.__name__),
+                  file=sys.stderr)
+
+    directory = tempfile.mkdtemp()
+    fix_inequality()
+    browser = make_browser(args.browser)
+    profiler = CommandProfiler()
+    profiler.instrument(browser)
+    results = {}
+    try:
+        urls = write_pages(directory, args.pages)
+        for name, _, _ in PAGES:
+            if name not in urls:
+                continue
+            test = BenchmarkTest(browser, {'benchmark': urls[name]})
+            for c in CASES:
+                if c['pages'] and name not in c['pages']:
+                    continue
+                if args.match and args.match not in c['step']:
+                    continue
+                result = run_case(test, profiler, steps, urls[name],
+                                  c['step'], c['setup'], args.repeat)
+                results['{} | {}'.format(name, c['step'])] = result
+                print('{:<10} {:<70.70} {}'.format(
+                    name, c['step'].split('\n')[0], format_result(result)))
+    finally:
+        browser.quit()
+        shutil.rmtree(directory)
+
+    label = args.label or current_commit()
+    if not os.path.isdir(args.results):
+        os.makedirs(args.results)
+    with open(os.path.join(args.results, label + '.json'), 'w') as f:
+        json.dump({
+            'label': label,
+            'browser': args.browser,
+            'repeat': args.repeat,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+    print('Saved results as {}'.format(label))
+
+    if args.baseline:
+        return compare_runs(args.results, args.baseline, label,
+                            args.threshold)
+    return 0
+
+
+def format_result(result):
+    if 'error' in result:
+        return 'error: {}'.format(result['error'].split('\n')[0])
+    return '{:9.1f} ms {:5g} commands'.format(result['median'] * 1000,
+                                              result['commands'])
+
+
+def load_run(directory, label):
+    with open(os.path.join(directory, label + '.json')) as f:
+        return json.load(f)['results']
+
+
+def compare_runs(directory, base_label, head_label, threshold):
+    """Print a table of the changes between two runs; 1 if any regressed."""
+    base = load_run(directory, base_label)
+    head = load_run(directory, head_label)
+    regressions = 0
+
+    print('{:<80} {:>10} {:>10} {:>8} {:>6} {:>6}'.format(
+        'page | step', base_label, head_label, 'change', 'cmds', 'cmds'))
+    for key in sorted(set(base) | set(head)):
+        before = base.get(key, {})
+        after = head.get(key, {})
+        name = key.split('\n')[0]
+        if 'median' not in before or 'median' not in after:
+            print('{:<80.80} {:>10} {:>10}'.format(
+                name,
+                'error' if 'error' in before else '-' if not before else
+                '{:.1f}'.format(before['median'] * 1000),
+                'error' if 'error' in after else '-' if not after else
+                '{:.1f}'.format(after['median'] * 1000),
+            ))
+            continue
+
+        change = (after['median'] - before['median']) / max(before['median'],
+                                                            1e-6)
+        regressed = (change > threshold or
+                     after['commands'] > before['commands'])
+        regressions += regressed
+        print('{:<80.80} {:>10.1f} {:>10.1f} {:>+7.0%} {:>6g} {:>6g}{}'.format(
+            name,
+            before['median'] * 1000,
+            after['median'] * 1000,
+            change,
+            before['commands'],
+            after['commands'],
+            '  REGRESSED' if regressed else '',
+        ))
+
+    print('{} regressions'.format(regressions))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--results', default=DEFAULT_RESULTS,
+                        help='Directory of saved results')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Slowdown, as a fraction, counted as a '
+                             'regression')
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help='Benchmark the steps')
+    run_parser.add_argument('--browser', choices=('firefox', 'chrome'),
+                            default='firefox')
+    run_parser.add_argument('--repeat', type=int, default=5)
+    run_parser.add_argument('--pages', nargs='*',
+                            choices=[name for name, _, _ in PAGES],
+                            help='Only benchmark these pages')
+    run_parser.add_argument('--match',
+                            help='Only benchmark steps containing this text')
+    run_parser.add_argument('--label',
+                            help='Save results under this name instead of '
+                                 'the current commit')
+    run_parser.add_argument('--baseline',
+                            help='Compare against these saved results')
+
+    compare_parser = commands.add_parser('compare',
+                                         help='Compare two saved runs')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('head')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        return run(args)
+    if args.command == 'compare':
+        return compare_runs(args.results, args.base, args.head,
+                            args.threshold)
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""Read options from the [planterbox] section of the nose2 config.
+
+This module imports nothing from the rest of the package, so any module can
+import it.
+"""
+
+
+def config_option(test, key, default=None):
+    """
+    Read a single value from the [planterbox] section of the nose2 config.
+
+    Falls back to 'default' when the option isn't set, or when the test
+    wasn't given a config at all.
+    """
+    config = getattr(test, 'config', None)
+    if config is None:
+        return default
+    return config.as_str(key, default)
+
+
+def config_flag(test, key, default=False):
+    """Read a true/false option from the [planterbox] section."""
+    config = getattr(test, 'config', None)
+    if config is None:
+        return default
+    return config.as_bool(key, default)
@@ -1,87 +1,485 @@
+from functools import partial
+import io
 import os.path
 import time
 
 from planterbox import step
 
-from selenium.common.exceptions import WebDriverException
-
+from .config import config_option
+from .readiness import wait_until_idle
+from .tracing import span
 from .util import (
+    fill_in,
+    preload_script,
     submit_form,
+    wait_for_mutation,
 )
 
 import logging
 log = logging.getLogger(__name__)
 
 
-def wait_for_elem(browser, sel, timeout=15):
+JQUERY_ELEMENTS_CONDITION = u"""
+function condition(selector) {
+    return window.jQuery(selector).get();
+}
+"""
+
+
+def poll_for_elem(browser, sel, timeout=15, engine=None):
     start = time.time()
     elems = []
     while time.time() - start < timeout:
-        elems = find_elements_by_jquery(browser, sel)
+        with span('poll', 'wait', selector=sel):
+            elems = find_elements_by_jquery(browser, sel, engine=engine)
         if elems:
             return elems
-        time.sleep(0.2)
+        with span('sleep', 'wait'):
+            time.sleep(0.2)
     return elems
 
 
-def load_jquery(browser):
-    """Ensure that JQuery is available to the browser."""
-    jquery = open(os.path.abspath(
-        os.path.join(os.path.dirname(__file__), 'jquery-2.2.0.min.js')
-    ))
-    browser.execute_script(jquery.read())
+def wait_for_elem(browser, sel, timeout=15, engine=None):
+    with span('wait for element', 'wait', selector=sel):
+        return _wait_for_elem(browser, sel, timeout=timeout, engine=engine)
 
 
-def find_elements_by_jquery(browser, selector):
-    """Find HTML elements using jQuery-style selectors.
+def _wait_for_elem(browser, sel, timeout, engine):
+    start = time.time()
+    engine = engine or SELECTOR_ENGINE
+    condition = JQUERY_ELEMENTS_CONDITION
+    elems = None
+    if engine != 'jquery':
+        elems = query_native(browser, sel)
+        if elems is NATIVE_UNSUPPORTED:
+            if engine == 'native':
+                raise native_unsupported(sel)
+            elems = None
+        else:
+            condition = NATIVE_ELEMENTS_CONDITION
+    if elems is None:
+        # Also makes sure jQuery is loaded before waiting on it in the
+        # browser.
+        elems = query_jquery(browser, sel)
+    if elems:
+        return elems
+    return wait_for_mutation(browser, condition, sel,
+                             timeout=timeout - (time.time() - start),
+                             fallback=partial(poll_for_elem, browser, sel,
+                                              engine=engine))
+
+
+JQUERY_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), 'jquery-2.2.0.min.js')
+)
+
+_jquery_source = None
+
+
+def jquery_source():
+    """The bundled jQuery, read from disk once per process."""
+    global _jquery_source
+    if _jquery_source is None:
+        with io.open(JQUERY_PATH, encoding='utf-8') as f:
+            _jquery_source = f.read()
+    return _jquery_source
+
+
+# Hand '$' back to the page if it already had one, so that injecting jQuery
+# doesn't break pages that use '$' for something else.
+JQUERY_INJECT_SCRIPT = u"""
+var hadDollar = typeof window.$ !== 'undefined';
+{source}
+;if (hadDollar) {{
+    window.jQuery.noConflict();
+}}
+"""
+
+JQUERY_QUERY_SCRIPT = u"""
+if (typeof window.jQuery === 'undefined') {
+    return {missing: true};
+}
+var found = window.jQuery(arguments[0]);
+if (arguments[1]) {
+    found = found.parent();
+}
+return {elements: found.get()};
+"""
 
-    Ensures that jQuery is available to the browser; if it gets a
-    WebDriverException that looks like jQuery is not available, it attempts to
-    include it and reexecute the script."""
-    try:
-        return browser.execute_script(
-            """return ($ || jQuery)(arguments[0]).get();""", selector
+
+def preload_jquery(browser):
+    """Have the browser evaluate jQuery on every new document.
+
+    Returns whether jQuery is preloaded for this session."""
+    return preload_script(
+        browser, 'jquery',
+        lambda: JQUERY_INJECT_SCRIPT.format(source=jquery_source()),
+    )
+
+
+def load_jquery(browser):
+    """Ensure that JQuery is available to the browser."""
+    browser.execute_script(JQUERY_INJECT_SCRIPT.format(source=jquery_source()))
+
+
+def query_jquery(browser, selector, parents=False):
+    """Run a jQuery selector in the browser and return the matched elements.
+
+    The query checks for jQuery as it runs, so it costs a single command when
+    jQuery is already on the page; otherwise jQuery is sent along with a
+    second attempt at the query."""
+    preload_jquery(browser)
+    result = browser.execute_script(JQUERY_QUERY_SCRIPT, selector, parents)
+    if result.get('missing'):
+        result = browser.execute_script(
+            JQUERY_INJECT_SCRIPT.format(source=jquery_source()) +
+            JQUERY_QUERY_SCRIPT,
+            selector, parents,
         )
-    except WebDriverException as e:
-        if u'$ is not defined' in e.msg:
-            load_jquery(browser)
-            return browser.execute_script(
-                """return ($ || jQuery)(arguments[0]).get();""", selector,
-            )
-        else:
-            raise
+    return result['elements']
+
+
+# The jQuery extensions to CSS that the native engine understands. Everything
+# else is handed to querySelectorAll, and anything that isn't valid CSS makes
+# select() return null.
+SELECTOR_SHIM_SCRIPT = u"""
+function hasLayout(el) {
+    return !!(el.offsetWidth || el.offsetHeight ||
+              el.getClientRects().length);
+}
+
+// Like jQuery, match on the type property, so a <button> with no type
+// attribute is a submit button.
+function ofType(tags, type) {
+    return function (el) {
+        return tags.indexOf(el.tagName) !== -1 && el.type === type;
+    };
+}
+
+var SHIM_FILTERS = {
+    contains: function (el, text) {
+        return el.textContent.indexOf(text) !== -1;
+    },
+    visible: hasLayout,
+    hidden: function (el) { return !hasLayout(el); },
+    selected: function (el) { return el.selected === true; },
+    input: function (el) {
+        return el.matches('input, select, textarea, button');
+    },
+    button: function (el) {
+        return el.matches('button, input[type="button"]');
+    },
+    text: function (el) {
+        var type = el.getAttribute('type');
+        return el.tagName === 'INPUT' &&
+            (type === null || type.toLowerCase() === 'text');
+    },
+    submit: ofType(['INPUT', 'BUTTON'], 'submit'),
+    reset: ofType(['INPUT', 'BUTTON'], 'reset')
+};
+['checkbox', 'radio', 'password', 'file', 'image'].forEach(function (type) {
+    SHIM_FILTERS[type] = ofType(['INPUT'], type);
+});
+
+var SHIM_POSITIONS = {
+    first: function (set) { return set.slice(0, 1); },
+    last: function (set) { return set.slice(-1); },
+    eq: function (set, n) {
+        var i = +n < 0 ? set.length + +n : +n;
+        return i >= 0 && i < set.length ? [set[i]] : [];
+    }
+};
+
+function isShimmed(name) {
+    return Object.prototype.hasOwnProperty.call(SHIM_FILTERS, name) ||
+        Object.prototype.hasOwnProperty.call(SHIM_POSITIONS, name);
+}
+
+// Index just past the end of the quoted string, bracket or parenthesis that
+// starts at 'start'.
+function skipNested(selector, start) {
+    var closers = {'(': ')', '[': ']'}, stack = [], quote = null;
+    for (var i = start; i < selector.length; i++) {
+        var c = selector.charAt(i);
+        if (c === '\\\\') {
+            i++;
+        } else if (quote !== null) {
+            if (c === quote) {
+                quote = null;
+                if (!stack.length) {
+                    return i + 1;
+                }
+            }
+        } else if (c === '"' || c === "'") {
+            quote = c;
+        } else if (closers[c]) {
+            stack.push(closers[c]);
+        } else if (c === stack[stack.length - 1]) {
+            stack.pop();
+            if (!stack.length) {
+                return i + 1;
+            }
+        }
+    }
+    return selector.length;
+}
+
+function unquote(arg) {
+    arg = arg.trim();
+    var first = arg.charAt(0);
+    if ((first === '"' || first === "'") && arg.charAt(arg.length - 1) === first) {
+        return arg.slice(1, -1);
+    }
+    return arg;
+}
+
+// Split a selector into comma separated groups, each a list alternating
+// between CSS text and the shimmed pseudo-classes.
+function parseSelector(selector) {
+    var groups = [], parts = [], css = '', i = 0;
+    while (i < selector.length) {
+        var c = selector.charAt(i), name;
+        if (c === '\\\\') {
+            css += selector.slice(i, i + 2);
+            i += 2;
+        } else if ('"\\'(['.indexOf(c) !== -1) {
+            var end = skipNested(selector, i);
+            css += selector.slice(i, end);
+            i = end;
+        } else if (c === ',') {
+            parts.push(css);
+            groups.push(parts);
+            parts = [];
+            css = '';
+            i++;
+        } else if (c === ':' && selector.charAt(i + 1) !== ':' &&
+                   (name = /^[\\w-]+/.exec(selector.slice(i + 1))) !== null &&
+                   isShimmed(name[0])) {
+            var pseudo = {name: name[0], arg: null};
+            i += 1 + name[0].length;
+            if (selector.charAt(i) === '(') {
+                var close = skipNested(selector, i);
+                pseudo.arg = unquote(selector.slice(i + 1, close - 1));
+                i = close;
+            }
+            // 'div :visible' means any visible descendant of a div
+            if (/[\\s>+~]$/.test(css)) {
+                css += '*';
+            }
+            parts.push(css, pseudo);
+            css = '';
+        } else {
+            css += c;
+            i++;
+        }
+    }
+    parts.push(css);
+    groups.push(parts);
+    return groups;
+}
+
+function documentOrder(elements) {
+    return Array.from(new Set(elements)).sort(function (a, b) {
+        return a.compareDocumentPosition(b) & Node.DOCUMENT_POSITION_FOLLOWING ?
+            -1 : 1;
+    });
+}
+
+// Continue selecting from a set of elements: a leading compound selector
+// filters the set, and anything after a combinator searches relative to it.
+function applyCss(set, css) {
+    if (!css.trim()) {
+        return set;
+    }
+    if (set === null) {
+        return Array.from(document.querySelectorAll(css));
+    }
+
+    var split = 0;
+    while (split < css.length && !/[\\s>+~]/.test(css.charAt(split))) {
+        split = '"\\'(['.indexOf(css.charAt(split)) !== -1 ?
+            skipNested(css, split) : split + 1;
+    }
+    var compound = css.slice(0, split), rest = css.slice(split);
+    if (compound) {
+        set = set.filter(function (el) { return el.matches(compound); });
+    }
+    if (!rest.trim()) {
+        return set;
+    }
+
+    var found = [], sibling = /^\\s*[+~]/.test(rest);
+    set.forEach(function (el) {
+        var matches;
+        if (!sibling) {
+            matches = el.querySelectorAll(':scope' + rest);
+        } else if (el.parentElement !== null) {
+            var index = Array.prototype.indexOf.call(
+                el.parentElement.children, el) + 1;
+            matches = el.parentElement.querySelectorAll(
+                ':scope > :nth-child(' + index + ')' + rest);
+        } else {
+            return;
+        }
+        found.push.apply(found, matches);
+    });
+    return documentOrder(found);
+}
+
+function applyPseudo(set, pseudo) {
+    if (set === null) {
+        set = Array.from(document.querySelectorAll('*'));
+    }
+    if (Object.prototype.hasOwnProperty.call(SHIM_POSITIONS, pseudo.name)) {
+        return SHIM_POSITIONS[pseudo.name](set, pseudo.arg);
+    }
+    return set.filter(function (el) {
+        return SHIM_FILTERS[pseudo.name](el, pseudo.arg);
+    });
+}
+
+function select(selector) {
+    var found = [];
+    try {
+        parseSelector(selector).forEach(function (parts) {
+            var set = null;
+            parts.forEach(function (part) {
+                set = typeof part === 'string' ?
+                    applyCss(set, part) : applyPseudo(set, part);
+            });
+            found.push.apply(found, set || []);
+        });
+    } catch (e) {
+        if (e.name === 'SyntaxError') {
+            return null;
+        }
+        throw e;
+    }
+    return documentOrder(found);
+}
+"""
+
+# Keep the shim on the page, so only the short query script is sent while it
+# stays on the same document.
+NATIVE_INSTALL_SCRIPT = u"""
+window.__planterboxSelector = (function () {
+""" + SELECTOR_SHIM_SCRIPT + u"""
+return {select: select, documentOrder: documentOrder};
+})();
+"""
+
+NATIVE_QUERY_SCRIPT = u"""
+var shim = window.__planterboxSelector;
+if (typeof shim === 'undefined') {
+    return {missing: true};
+}
+var found = shim.select(arguments[0]);
+if (found !== null && arguments[1]) {
+    found = shim.documentOrder(found.map(function (el) {
+        return el.parentElement;
+    }).filter(function (el) { return el !== null; }));
+}
+return {elements: found};
+"""
+
+NATIVE_ELEMENTS_CONDITION = SELECTOR_SHIM_SCRIPT + u"""
+function condition(selector) {
+    return select(selector) || [];
+}
+"""
+
+
+# Which engine runs $("...") selectors: 'jquery' injects jQuery into the page,
+# 'native' only uses querySelectorAll and the shimmed jQuery extensions, and
+# 'auto' uses the native engine unless the selector needs jQuery.
+SELECTOR_ENGINE = 'jquery'
+
+SELECTOR_ENGINES = ('jquery', 'native', 'auto')
+
+
+def selector_engine(test):
+    """The selector engine configured as 'selector.engine'."""
+    engine = config_option(test, 'selector.engine', SELECTOR_ENGINE)
+    if engine not in SELECTOR_ENGINES:
+        raise ValueError(u'Unknown selector engine: {}'.format(engine))
+    return engine
+
+
+# Returned by query_native for selectors that need more of jQuery than the
+# shim has.
+NATIVE_UNSUPPORTED = object()
+
+# Selectors the shim can't handle, which only depends on their syntax, so
+# they aren't sent to the browser again.
+_native_unsupported_selectors = set()
+
+
+def query_native(browser, selector, parents=False):
+    """Run a selector with querySelectorAll and the jQuery extension shim.
+
+    The shim is only sent along with the query when the page doesn't have it
+    yet. Returns NATIVE_UNSUPPORTED, without a command if the selector has
+    been seen before, if the selector needs more of jQuery than the shim
+    has."""
+    if selector in _native_unsupported_selectors:
+        return NATIVE_UNSUPPORTED
+    result = browser.execute_script(NATIVE_QUERY_SCRIPT, selector, parents)
+    if result.get('missing'):
+        result = browser.execute_script(
+            NATIVE_INSTALL_SCRIPT + NATIVE_QUERY_SCRIPT, selector, parents)
+    if result['elements'] is None:
+        _native_unsupported_selectors.add(selector)
+        return NATIVE_UNSUPPORTED
+    return result['elements']
+
+
+def native_unsupported(selector):
+    return ValueError(
+        u'Not supported by the native selector engine: {}'.format(selector))
+
+
+def query_selector(browser, selector, parents=False, engine=None):
+    """Find the elements (or their parents) matching a selector."""
+    engine = engine or SELECTOR_ENGINE
+    if engine != 'jquery':
+        elements = query_native(browser, selector, parents)
+        if elements is not NATIVE_UNSUPPORTED:
+            return elements
+        if engine == 'native':
+            raise native_unsupported(selector)
+    return query_jquery(browser, selector, parents)
+
+
+def find_elements_by_jquery(browser, selector, engine=None):
+    """Find HTML elements using jQuery-style selectors.
+
+    Ensures that jQuery is available to the browser, injecting it if the page
+    doesn't have it yet, unless a native selector engine can handle the
+    selector."""
+    return query_selector(browser, selector, engine=engine)
 
 
 def find_element_by_jquery(test, browser, selector):
     """Find a single HTML element using jQuery-style selectors."""
-    elements = find_elements_by_jquery(browser, selector)
+    elements = find_elements_by_jquery(browser, selector,
+                                       engine=selector_engine(test))
     test.assertGreater(len(elements), 0,
                        u'No elements matched: {}'.format(selector))
     return elements[0]
 
 
-def find_parents_by_jquery(browser, selector):
+def find_parents_by_jquery(browser, selector, engine=None):
     """Find HTML elements' parents using jQuery-style selectors.
 
-    In addition to reliably including jQuery, this also finds the pa"""
-    try:
-        return browser.execute_script(
-            """return ($ || jQuery)(arguments[0]).parent().get();""", selector
-        )
-    except WebDriverException as e:
-        if e.msg.startswith(u'$ is not defined'):
-            load_jquery(browser)
-            return browser.execute_script(
-                """return ($ || jQuery)(arguments[0]).parent().get();""",
-                selector,
-            )
-        else:
-            raise
+    In addition to reliably including jQuery, this also finds the parents of
+    the matched elements."""
+    return query_selector(browser, selector, parents=True, engine=engine)
 
 
 @step(r'There should be an element matching \$\("(.*?)"\)$')
 def check_element_by_selector(test, selector):
-    elems = find_elements_by_jquery(test.browser, selector)
+    elems = find_elements_by_jquery(test.browser, selector,
+                                    engine=selector_engine(test))
     test.assertTrue(elems)
 
 
@@ -89,21 +487,32 @@ def check_element_by_selector(test, selector):
     r'There should be an element matching \$\("(.*?)"\) within (\d+) seconds?$'
 )
 def wait_for_element_by_selector(test, selector, seconds):
-    elems = wait_for_elem(test.browser, selector, int(seconds))
+    elems = wait_for_elem(test.browser, selector, int(seconds),
+                          engine=selector_engine(test))
     test.assertTrue(elems)
 
 
 @step(r'There should be exactly (\d+) elements matching \$\("(.*?)"\)$')
 def count_elements_exactly_by_selector(test, number, selector):
-    elems = find_elements_by_jquery(test.browser, selector)
+    elems = find_elements_by_jquery(test.browser, selector,
+                                    engine=selector_engine(test))
     test.assertEqual(len(elems), int(number))
 
 
 @step(r'I fill in \$\("(.*?)"\) with "(.*?)"$')
-def fill_in_by_selector(test, selector, value):
+def fill_in_by_selector(test, selector, value, strategy=None):
     elem = find_element_by_jquery(test, test.browser, selector)
-    elem.clear()
-    elem.send_keys(value)
+    fill_in(test, elem, value, strategy=strategy)
+
+
+@step(r'I set \$\("(.*?)"\) to "(.*?)"$')
+def set_by_selector(test, selector, value):
+    fill_in_by_selector(test, selector, value, strategy='set')
+
+
+@step(r'I type "(.*?)" into \$\("(.*?)"\)$')
+def type_by_selector(test, value, selector):
+    fill_in_by_selector(test, selector, value, strategy='type')
 
 
 @step(r'I submit \$\("(.*?)"\)')
@@ -142,18 +551,21 @@ def selected_by_selector(test, selector):
 @step(r'I select \$\("(.*?)"\)$')
 def select_by_selector(test, selector):
     option = find_element_by_jquery(test, test.browser, selector)
-    selectors = find_parents_by_jquery(test.browser, selector)
+    selectors = find_parents_by_jquery(test.browser, selector,
+                                       engine=selector_engine(test))
     test.assertGreater(len(selectors), 0)
     selector = selectors[0]
     selector.click()
-    time.sleep(0.3)
+    # Let any dropdown animation finish before picking the option.
+    wait_until_idle(test.browser, timeout=5, checks=('animations',), quiet=0)
     option.click()
     test.assertTrue(option.is_selected())
 
 
 @step(r'There should not be an element matching \$\("(.*?)"\)$')
 def check_no_element_by_selector(test, selector):
-    elems = find_elements_by_jquery(test.browser, selector)
+    elems = find_elements_by_jquery(test.browser, selector,
+                                    engine=selector_engine(test))
     test.assertFalse(elems)
 
 
@@ -0,0 +1,232 @@
+"""Launch browsers configured from the [planterbox] section of unittest.cfg.
+
+    [planterbox]
+    browser = chrome
+    browser.headless = true
+    browser.page-load-strategy = eager
+    browser.block-images = true
+    browser.block-fonts = true
+    browser.disable-animations = true
+    browser.window-size = 1280x800
+    browser.implicit-wait = 0
+    browser.script-timeout = 30
+    browser.remote-url = http://localhost:4444
+
+Every option is optional; with none set, this launches a headed Firefox with
+the driver's defaults. If 'proxy' is enabled, browsers send their requests
+through planterbox_webdriver.proxy. The browser pool and prewarming hooks use
+this factory unless 'pool.factory' names another.
+"""
+
+from importlib import import_module
+from time import time
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.common.proxy import Proxy, ProxyType
+
+from .config import (
+    config_flag,
+    config_option,
+)
+from .proxy import get_proxy
+from .util import preload_script
+
+import logging
+log = logging.getLogger(__name__)
+
+
+BROWSERS = ('firefox', 'chrome', 'edge')
+
+PAGE_LOAD_STRATEGIES = ('normal', 'eager', 'none')
+
+FONT_URL_PATTERNS = ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot']
+
+DISABLE_ANIMATIONS_SCRIPT = u"""
+(function () {
+    var css = '*, *::before, *::after {' +
+        'animation-duration: 0s !important;' +
+        'animation-delay: 0s !important;' +
+        'transition-duration: 0s !important;' +
+        'transition-delay: 0s !important;' +
+        'scroll-behavior: auto !important; }';
+    function add() {
+        var style = document.createElement('style');
+        style.textContent = css;
+        (document.head || document.documentElement).appendChild(style);
+    }
+    if (document.documentElement) {
+        add();
+    } else {
+        document.addEventListener('DOMContentLoaded', add);
+    }
+})();
+"""
+
+
+def import_factory(path):
+    """Import a driver factory given as 'package.module.callable'."""
+    module_name, _, name = path.rpartition('.')
+    return getattr(import_module(module_name), name)
+
+
+def parse_window_size(size):
+    """'1280x800' as (1280, 800)."""
+    width, _, height = size.lower().partition('x')
+    return int(width), int(height)
+
+
+class DriverFactory(object):
+    """
+    Launches browsers with settings chosen for fast, reproducible tests.
+
+    Settings go into the browser's options wherever possible, so they cost no
+    commands once the browser has started.
+    """
+
+    def __init__(self, browser='firefox', headless=False,
+                 page_load_strategy='normal', block_images=False,
+                 block_fonts=False, disable_animations=False,
+                 window_size=None, implicit_wait=None, script_timeout=None,
+                 remote_url=None, proxy=None):
+        if browser not in BROWSERS:
+            raise ValueError(
+                u'Unknown browser {!r}, expected one of {}'.format(
+                    browser, ', '.join(BROWSERS)))
+        if page_load_strategy not in PAGE_LOAD_STRATEGIES:
+            raise ValueError(
+                u'Unknown page load strategy {!r}, expected one of {}'.format(
+                    page_load_strategy, ', '.join(PAGE_LOAD_STRATEGIES)))
+        self.browser = browser
+        self.headless = headless
+        self.page_load_strategy = page_load_strategy
+        self.block_images = block_images
+        self.block_fonts = block_fonts
+        self.disable_animations = disable_animations
+        self.window_size = window_size
+        self.implicit_wait = implicit_wait
+        self.script_timeout = script_timeout
+        self.remote_url = remote_url
+        self.proxy = proxy
+
+    @classmethod
+    def from_config(cls, test):
+        proxy = get_proxy(test)
+        window_size = config_option(test, 'browser.window-size')
+        implicit_wait = config_option(test, 'browser.implicit-wait')
+        script_timeout = config_option(test, 'browser.script-timeout')
+        return cls(
+            browser=config_option(test, 'browser', 'firefox').lower(),
+            headless=config_flag(test, 'browser.headless'),
+            page_load_strategy=config_option(
+                test, 'browser.page-load-strategy', 'normal').lower(),
+            block_images=config_flag(test, 'browser.block-images'),
+            block_fonts=config_flag(test, 'browser.block-fonts'),
+            disable_animations=config_flag(test,
+                                           'browser.disable-animations'),
+            window_size=window_size and parse_window_size(window_size),
+            implicit_wait=implicit_wait and float(implicit_wait),
+            script_timeout=script_timeout and float(script_timeout),
+            remote_url=config_option(test, 'browser.remote-url'),
+            proxy=proxy and proxy.address,
+        )
+
+    def options(self):
+        if self.browser == 'firefox':
+            options = webdriver.FirefoxOptions()
+            self.firefox_options(options)
+        else:
+            if self.browser == 'chrome':
+                options = webdriver.ChromeOptions()
+            else:
+                options = webdriver.EdgeOptions()
+            self.chromium_options(options)
+
+        options.page_load_strategy = self.page_load_strategy
+        timeouts = {}
+        if self.implicit_wait is not None:
+            timeouts['implicit'] = int(self.implicit_wait * 1000)
+        if self.script_timeout is not None:
+            timeouts['script'] = int(self.script_timeout * 1000)
+        if timeouts:
+            options.timeouts = timeouts
+        if self.proxy:
+            options.proxy = Proxy({
+                'proxyType': ProxyType.MANUAL,
+                'httpProxy': self.proxy,
+                'sslProxy': self.proxy,
+                'noProxy': ['localhost', '127.0.0.1'],
+            })
+        return options
+
+    def firefox_options(self, options):
+        if self.headless:
+            options.add_argument('-headless')
+        if self.window_size:
+            options.add_argument('--width={}'.format(self.window_size[0]))
+            options.add_argument('--height={}'.format(self.window_size[1]))
+        if self.block_images:
+            options.set_preference('permissions.default.image', 2)
+        if self.block_fonts:
+            options.set_preference('gfx.downloadable_fonts.enabled', False)
+        if self.disable_animations:
+            options.set_preference('ui.prefersReducedMotion', 1)
+            # Preload scripts need WebDriver BiDi.
+            options.enable_bidi = True
+
+    def chromium_options(self, options):
+        if self.headless:
+            options.add_argument('--headless=new')
+        if self.window_size:
+            options.add_argument('--window-size={},{}'.format(
+                *self.window_size))
+        if self.block_images:
+            options.add_experimental_option('prefs', {
+                'profile.managed_default_content_settings.images': 2,
+            })
+        if self.disable_animations:
+            options.add_argument('--force-prefers-reduced-motion')
+
+    def launch(self, options):
+        if self.remote_url:
+            return webdriver.Remote(command_executor=self.remote_url,
+                                    options=options)
+        driver_class = {
+            'firefox': webdriver.Firefox,
+            'chrome': webdriver.Chrome,
+            'edge': webdriver.Edge,
+        }[self.browser]
+        return driver_class(options=options)
+
+    def __call__(self):
+        start = time()
+        driver = self.launch(self.options())
+        if self.block_fonts and self.browser != 'firefox':
+            block_fonts(driver)
+        if (self.disable_animations and
+                not preload_script(driver, 'disable-animations',
+                                   DISABLE_ANIMATIONS_SCRIPT)):
+            log.warning('Could not disable animations for %s', self.browser)
+        log.info('Started %s in %.2fs', self.browser, time() - start)
+        return driver
+
+
+def block_fonts(driver):
+    """Block web font requests in a Chromium browser over CDP."""
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs',
+                               {'urls': FONT_URL_PATTERNS})
+    except (AttributeError, WebDriverException):
+        log.warning('Could not block fonts', exc_info=True)
+
+
+def driver_factory(test):
+    """
+    The callable that launches browsers: 'pool.factory' if it's set,
+    otherwise a DriverFactory configured by the test's config.
+    """
+    path = config_option(test, 'pool.factory')
+    if path:
+        return import_factory(path)
+    return DriverFactory.from_config(test)
@@ -0,0 +1,207 @@
+"""Serve a directory of fixture pages over HTTP.
+
+file:// URLs can't exercise HTTP caching, keep-alive or XHR. Instead, build
+a test package's PAGES from a local server:
+
+    from planterbox_webdriver.fixture_server import serve_pages
+
+    PAGES = serve_pages(os.path.dirname(__file__))
+
+The server starts the first time a directory is served in a process, runs on
+a daemon thread on a free port and handles each connection on its own thread.
+Responses carry an ETag, a Cache-Control header and, when the browser accepts
+it, gzip compression, and HTTP/1.1 connections are kept alive.
+"""
+
+import atexit
+import gzip
+import hashlib
+import io
+import mimetypes
+import os
+import os.path
+import posixpath
+import threading
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import unquote, urlsplit
+
+import logging
+log = logging.getLogger(__name__)
+
+
+DEFAULT_CACHE_CONTROL = 'no-cache'
+
+# Content types worth compressing.
+COMPRESSIBLE = (
+    'text/',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+)
+
+
+class FixtureFile(object):
+    """A file's content, ETag and, for compressible types, gzipped content."""
+
+    __slots__ = ('mtime', 'content_type', 'body', 'gzipped', 'etag')
+
+    def __init__(self, path):
+        self.mtime = os.path.getmtime(path)
+        self.content_type = (mimetypes.guess_type(path)[0] or
+                             'application/octet-stream')
+        if self.content_type.startswith('text/'):
+            self.content_type += '; charset=utf-8'
+        with open(path, 'rb') as f:
+            self.body = f.read()
+        self.etag = '"{}"'.format(hashlib.sha1(self.body).hexdigest())
+        self.gzipped = None
+        if self.content_type.startswith(COMPRESSIBLE):
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb', mtime=0) as f:
+                f.write(self.body)
+            self.gzipped = buf.getvalue()
+
+
+class FixtureRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.respond(include_body=True)
+
+    def do_HEAD(self):
+        self.respond(include_body=False)
+
+    def respond(self, include_body):
+        fixture = self.server.fixture(urlsplit(self.path).path)
+        if fixture is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if fixture.etag in self.headers.get('If-None-Match', ''):
+            self.send_response(304)
+            self.send_header('ETag', fixture.etag)
+            self.send_header('Cache-Control', self.server.cache_control)
+            self.end_headers()
+            return
+
+        body = fixture.body
+        self.send_response(200)
+        self.send_header('Content-Type', fixture.content_type)
+        self.send_header('ETag', fixture.etag)
+        self.send_header('Cache-Control', self.server.cache_control)
+        if fixture.gzipped is not None:
+            self.send_header('Vary', 'Accept-Encoding')
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = fixture.gzipped
+                self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+class FixtureServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Serves the files in 'directory', keeping each in memory until it changes.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, directory, host='127.0.0.1', port=0,
+                 cache_control=DEFAULT_CACHE_CONTROL):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port),
+                                           FixtureRequestHandler)
+        self.directory = os.path.abspath(directory)
+        self.cache_control = cache_control
+        self._files = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def url(self, name):
+        return self.base_url + name
+
+    def fixture(self, url_path):
+        """The file for a request path, or None if there's no such file."""
+        parts = [part for part in
+                 posixpath.normpath(unquote(url_path)).split('/')
+                 if part not in ('', '.', '..')]
+        path = os.path.join(self.directory, *parts)
+        if os.path.isdir(path):
+            path = os.path.join(path, 'index.html')
+        if not os.path.isfile(path):
+            return None
+
+        with self._lock:
+            fixture = self._files.get(path)
+            if fixture is None or fixture.mtime != os.path.getmtime(path):
+                fixture = self._files[path] = FixtureFile(path)
+        return fixture
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        name='fixture-server')
+        self._thread.daemon = True
+        self._thread.start()
+        log.info('Serving %s at %s', self.directory, self.base_url)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def pages(self, extension='.html'):
+        """URLs for the directory's pages, named without the extension."""
+        return dict(
+            (filename[:-len(extension)], self.url(filename))
+            for filename in sorted(os.listdir(self.directory))
+            if filename.endswith(extension)
+        )
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def fixture_server(directory, **kwargs):
+    """The process's server for 'directory', started on first use."""
+    directory = os.path.abspath(directory)
+    with _servers_lock:
+        server = _servers.get(directory)
+        if server is None:
+            if not _servers:
+                atexit.register(stop_fixture_servers)
+            server = _servers[directory] = FixtureServer(directory, **kwargs)
+            server.start()
+    return server
+
+
+def serve_pages(directory, pages=None, **kwargs):
+    """
+    Serve a directory of pages and register their URLs in 'pages'.
+
+    Returns the pages, a new dict if none was given, mapping each '.html'
+    file's name to its URL.
+    """
+    if pages is None:
+        pages = {}
+    pages.update(fixture_server(directory, **kwargs).pages())
+    return pages
+
+
+def stop_fixture_servers():
+    with _servers_lock:
+        servers = list(_servers.values())
+        _servers.clear()
+    for server in servers:
+        server.stop()
@@ -0,0 +1,151 @@
+"""Run features in parallel with nose2's multiprocess plugin.
+
+Enable it alongside planterbox and nose2.plugins.mp in unittest.cfg:
+
+    [unittest]
+    plugins = planterbox
+              planterbox_webdriver.parallel
+              nose2.plugins.mp
+
+    [multiprocess]
+    processes = 4
+
+    [planterbox-parallel]
+    always-on = True
+
+Each worker process runs its own browser (use the hooks from
+planterbox_webdriver.pool, or your own) and saves screenshots in its own
+subdirectory, which are merged back together when the run finishes. Features
+are handed out longest first, using the durations recorded by earlier runs,
+so that a long feature doesn't start last and hold up the end of the run.
+"""
+
+from collections import defaultdict
+import json
+from multiprocessing import current_process
+import os
+import os.path
+import unittest
+
+from nose2.events import Plugin
+
+import logging
+log = logging.getLogger(__name__)
+
+
+WORKER_ENV = 'PLANTERBOX_WORKER'
+
+DEFAULT_DURATIONS = '.planterbox-durations.json'
+
+
+def worker_id():
+    """The name of this worker process, or None outside of a parallel run."""
+    return os.environ.get(WORKER_ENV)
+
+
+def worker_path(path):
+    """Add the worker's name to a per-process output file's name."""
+    worker = worker_id()
+    if not worker:
+        return path
+    base, extension = os.path.splitext(path)
+    return '{}.{}{}'.format(base, worker, extension)
+
+
+def flatten(suite):
+    """Yield every test case in a (nested) test suite."""
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for case in flatten(test):
+                yield case
+        else:
+            yield test
+
+
+def schedule(suite, durations):
+    """
+    Order a suite's tests longest first.
+
+    Tests without a recorded duration are assumed to be the longest, so that
+    new features don't end up at the tail of the run.
+    """
+    return unittest.TestSuite(sorted(
+        flatten(suite),
+        key=lambda test: -durations.get(test.id(), float('inf')),
+    ))
+
+
+def load_durations(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+class ParallelFeatures(Plugin):
+    """
+    Give each worker its own screenshot directory and schedule long features
+    first.
+    """
+
+    configSection = 'planterbox-parallel'
+
+    def __init__(self):
+        self.durations_path = self.config.as_str('durations',
+                                                 DEFAULT_DURATIONS)
+        self.durations = load_durations(self.durations_path)
+        self.in_worker = False
+        self._started = {}
+        self._elapsed = defaultdict(float)
+
+    def registerInSubprocess(self, event):
+        event.pluginClasses.append(self.__class__)
+
+    def startSubprocess(self, event):
+        self.in_worker = True
+        os.environ[WORKER_ENV] = 'worker-{}'.format(
+            current_process().name.rpartition('-')[2])
+
+    def startTestRun(self, event):
+        event.suite = schedule(event.suite, self.durations)
+
+    # planterbox reports each scenario as a test; add them up per feature.
+    def startTest(self, event):
+        if not self.in_worker:
+            self._started[event.test.id()] = event.startTime
+
+    def stopTest(self, event):
+        if not self.in_worker:
+            test_id = event.test.id()
+            started = self._started.pop(test_id, None)
+            if started is not None:
+                self._elapsed[test_id] += event.stopTime - started
+
+    def afterTestRun(self, event):
+        if self.in_worker:
+            return
+        self.durations.update(self._elapsed)
+        with open(self.durations_path, 'w') as f:
+            json.dump(self.durations, f, indent=2, sort_keys=True)
+
+        root = self.screenshot_root()
+        if root is not None and os.path.isdir(root):
+            from .screenshot import merge_worker_screenshots
+            merge_worker_screenshots(root)
+
+    def screenshot_root(self):
+        """The screenshot directory for this run, if screenshots are on."""
+        for plugin in self.session.plugins:
+            if getattr(plugin, 'configSection', None) != 'planterbox':
+                continue
+            config = plugin.config
+            try:
+                return os.path.join(
+                    config['screenshot.dir'][0],
+                    config['start_date'][0],
+                    config['screenshot.source'][0],
+                )
+            except (KeyError, IndexError):
+                return None
+        return None
@@ -0,0 +1,165 @@
+"""A pool of browser sessions shared between features.
+
+Starting a browser takes seconds, so instead of launching one in every
+'before feature' hook, import the hooks from here:
+
+    from planterbox_webdriver.pool import (
+        acquire_webdriver,
+        release_webdriver,
+    )
+
+Sessions are reset when a feature releases them, checked when they're handed
+out again, and replaced after 'pool.max-uses' features or if they crash. Set
+'prewarm.spares' to have replacements started in the background.
+"""
+
+import atexit
+import threading
+
+from planterbox import hook
+
+from selenium.common.exceptions import WebDriverException
+
+from .config import config_option
+from .factory import driver_factory
+from .monkeypatch import fix_inequality
+from .prewarm import prewarming_factory
+from .session import reset_session
+
+import logging
+log = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_USES = 50
+
+
+class DriverPool(object):
+    """
+    Hands out idle browser sessions, launching new ones only when needed.
+    """
+
+    def __init__(self, factory, max_uses=DEFAULT_MAX_USES):
+        self.factory = factory
+        self.max_uses = max_uses
+        self.launches = 0
+        self.reuses = 0
+        self._idle = []
+        self._uses = {}
+        self._lock = threading.Lock()
+
+    @property
+    def launches_avoided(self):
+        return self.reuses
+
+    def acquire(self):
+        """Return a healthy session, reusing an idle one if possible."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                driver = self._idle.pop()
+            if self.healthy(driver):
+                with self._lock:
+                    self._uses[driver] += 1
+                    self.reuses += 1
+                return driver
+            log.info('Discarding unresponsive browser session')
+            self.discard(driver)
+
+        driver = self.factory()
+        with self._lock:
+            self._uses[driver] = 1
+            self.launches += 1
+        return driver
+
+    def release(self, driver):
+        """Reset a session and return it to the pool for reuse."""
+        with self._lock:
+            worn_out = self._uses.get(driver, 0) >= self.max_uses
+            if worn_out:
+                self._uses.pop(driver, None)
+        if worn_out:
+            self.quit(driver)
+            return
+        try:
+            reset_session(driver)
+        except WebDriverException:
+            log.info('Discarding browser session that failed to reset',
+                     exc_info=True)
+            self.discard(driver)
+            return
+        with self._lock:
+            self._idle.append(driver)
+
+    def healthy(self, driver):
+        try:
+            return driver.execute_script('return 1;') == 1
+        except WebDriverException:
+            return False
+
+    def discard(self, driver):
+        """Quit a session and forget about it."""
+        with self._lock:
+            self._uses.pop(driver, None)
+        self.quit(driver)
+
+    @staticmethod
+    def quit(driver):
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    def close(self):
+        """Quit every idle session."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self.discard(driver)
+
+    def stats(self):
+        return {
+            'launches': self.launches,
+            'launches_avoided': self.launches_avoided,
+        }
+
+
+_pool = None
+
+
+def get_pool(test):
+    """The process-wide pool, created from the first test's config."""
+    global _pool
+    if _pool is None:
+        factory = driver_factory(test)
+        if config_option(test, 'prewarm.spares', None):
+            factory = prewarming_factory(test, factory)
+            atexit.register(factory.close)
+        _pool = DriverPool(
+            factory=factory,
+            max_uses=int(config_option(test, 'pool.max-uses',
+                                       DEFAULT_MAX_USES)),
+        )
+        atexit.register(close_pool)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    if _pool is not None:
+        log.info('Browser pool launched %(launches)d sessions and avoided '
+                 '%(launches_avoided)d launches', _pool.stats())
+        _pool.close()
+        _pool = None
+
+
+@hook('before', 'feature')
+def acquire_webdriver(test):
+    fix_inequality()
+    test.browser = get_pool(test).acquire()
+
+
+@hook('after', 'feature')
+def release_webdriver(test):
+    get_pool(test).release(test.browser)
+    test.browser = None
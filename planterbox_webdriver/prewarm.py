@@ -0,0 +1,177 @@
+"""Start the next browser while the current feature is still running.
+
+Launching a browser blocks the 'before feature' hook for seconds. Import these
+hooks instead of writing your own:
+
+    from planterbox_webdriver.prewarm import (
+        start_webdriver,
+        stop_webdriver,
+    )
+
+and each time a browser is handed out, 'prewarm.spares' more (1 by default)
+are started on background threads, so the next feature gets one that's
+already running. Spares older than 'prewarm.max-age' seconds are quit rather
+than used, and unused spares are quit when the process exits.
+
+Browsers are launched by planterbox_webdriver.factory, or 'pool.factory' if
+it's set. The browser pool uses a prewarming factory too if 'prewarm.spares'
+is set.
+"""
+
+import atexit
+import threading
+from time import time
+
+from planterbox import hook
+
+from .config import config_option
+from .factory import driver_factory
+from .monkeypatch import fix_inequality
+
+import logging
+log = logging.getLogger(__name__)
+
+
+DEFAULT_SPARES = 1
+
+DEFAULT_MAX_AGE = 300
+
+# How long to wait at exit for browsers that are still starting.
+SHUTDOWN_TIMEOUT = 30
+
+
+class PrewarmingFactory(object):
+    """
+    Wraps a driver factory, keeping spare browsers started in the background.
+    """
+
+    def __init__(self, factory, spares=DEFAULT_SPARES,
+                 max_age=DEFAULT_MAX_AGE):
+        self.factory = factory
+        self.spares = spares
+        self.max_age = max_age
+        self.prewarmed = 0
+        self._ready = []
+        self._launching = []
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def __call__(self):
+        """A started browser, launching one now only if no spare is coming."""
+        driver = self._take_spare()
+        if driver is None:
+            driver = self.factory()
+        self.prewarm()
+        return driver
+
+    def _take_spare(self):
+        expired = []
+        driver = None
+        with self._condition:
+            while driver is None:
+                while self._ready:
+                    started, spare = self._ready.pop(0)
+                    if time() - started > self.max_age:
+                        expired.append(spare)
+                    else:
+                        driver = spare
+                        self.prewarmed += 1
+                        break
+                if driver is not None or not self._launching:
+                    break
+                # A spare is on its way; waiting beats launching another.
+                self._condition.wait()
+        for spare in expired:
+            log.info('Quitting a spare browser older than %ss', self.max_age)
+            quit_quietly(spare)
+        return driver
+
+    def prewarm(self):
+        """Start launching spares until there are 'spares' ready or coming."""
+        with self._condition:
+            if self._closed:
+                return
+            needed = self.spares - len(self._ready) - len(self._launching)
+            for _ in range(needed):
+                thread = threading.Thread(target=self._launch,
+                                          name='prewarm-browser')
+                thread.daemon = True
+                self._launching.append(thread)
+                thread.start()
+
+    def _launch(self):
+        driver = None
+        try:
+            driver = self.factory()
+        except Exception:
+            log.warning('Could not start a spare browser', exc_info=True)
+        with self._condition:
+            self._launching.remove(threading.current_thread())
+            closed = self._closed
+            if driver is not None and not closed:
+                self._ready.append((time(), driver))
+            self._condition.notify_all()
+        if driver is not None and closed:
+            quit_quietly(driver)
+
+    def close(self, timeout=SHUTDOWN_TIMEOUT):
+        """Quit every spare, waiting for the ones still starting."""
+        with self._condition:
+            self._closed = True
+            ready, self._ready = self._ready, []
+            launching = list(self._launching)
+        for _, driver in ready:
+            quit_quietly(driver)
+        deadline = time() + timeout
+        for thread in launching:
+            thread.join(max(0, deadline - time()))
+
+
+def quit_quietly(driver):
+    try:
+        driver.quit()
+    except Exception:
+        log.debug('Could not quit a spare browser', exc_info=True)
+
+
+def prewarming_factory(test, factory):
+    """Wrap 'factory' with the 'prewarm.spares' and 'prewarm.max-age' set."""
+    return PrewarmingFactory(
+        factory,
+        spares=int(config_option(test, 'prewarm.spares', DEFAULT_SPARES)),
+        max_age=float(config_option(test, 'prewarm.max-age',
+                                    DEFAULT_MAX_AGE)),
+    )
+
+
+_factory = None
+
+
+def get_factory(test):
+    """The process-wide prewarming factory, created from the first test."""
+    global _factory
+    if _factory is None:
+        _factory = prewarming_factory(test, driver_factory(test))
+        atexit.register(close_factory)
+    return _factory
+
+
+def close_factory():
+    global _factory
+    if _factory is not None:
+        log.info('Prewarming handed out %d already-started browsers',
+                 _factory.prewarmed)
+        _factory.close()
+        _factory = None
+
+
+@hook('before', 'feature')
+def start_webdriver(test):
+    fix_inequality()
+    test.browser = get_factory(test)()
+
+
+@hook('after', 'feature')
+def stop_webdriver(test):
+    test.browser.quit()
+    test.browser = None
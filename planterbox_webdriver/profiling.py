@@ -0,0 +1,220 @@
+"""Count the WebDriver commands each step issues.
+
+Import the hooks into a feature's test module:
+
+    from planterbox_webdriver.profiling import *
+
+and every command sent to the browser is attributed to the step that sent it,
+with its latency and the size of the request and response. A summary,
+totalled per step, scenario, feature and step definition, is written to
+'profile.output' after each feature.
+
+Set 'profile.step-budget' to warn about (or, with 'profile.budget-action =
+fail', error on) any step that issues more commands than that.
+"""
+
+from collections import defaultdict
+import json
+import threading
+import time
+
+from planterbox import hook
+
+from six import text_type
+
+from .config import config_option
+from .parallel import worker_path
+
+import logging
+log = logging.getLogger(__name__)
+
+
+__all__ = [
+    'profile_step_start',
+    'profile_step_stop',
+    'profile_step_abandon',
+    'write_profile',
+]
+
+
+DEFAULT_OUTPUT = 'planterbox-profile.json'
+
+BUDGET_ACTIONS = ('warn', 'fail')
+
+
+class StepBudgetExceeded(AssertionError):
+    pass
+
+
+def payload_size(payload):
+    """The size in bytes of a command's parameters or response as JSON."""
+    if not payload:
+        return 0
+    return len(json.dumps(payload, default=text_type))
+
+
+def new_totals():
+    return {
+        'commands': 0,
+        'seconds': 0.0,
+        'bytes_sent': 0,
+        'bytes_received': 0,
+    }
+
+
+def add_totals(totals, record):
+    for key in ('commands', 'seconds', 'bytes_sent', 'bytes_received'):
+        totals[key] += record[key]
+
+
+class CommandProfiler(object):
+    """
+    Records the commands sent through each instrumented browser.
+
+    Commands sent while no step is running (from hooks, for instance) are
+    not attributed to anything and are only counted in 'unattributed'.
+    """
+
+    def __init__(self):
+        self.steps = []
+        self.current = None
+        self.unattributed = new_totals()
+        self._lock = threading.Lock()
+
+    def instrument(self, browser):
+        """Wrap a browser's command executor so its commands are recorded."""
+        executor = browser.command_executor
+        if getattr(executor, '_planterbox_profiler', None) is self:
+            return
+        execute = executor.execute
+
+        def profiled_execute(command, params=None):
+            started = time.time()
+            response = execute(command, params)
+            self.record(
+                command,
+                seconds=time.time() - started,
+                bytes_sent=payload_size(params),
+                bytes_received=payload_size(response),
+            )
+            return response
+
+        executor.execute = profiled_execute
+        executor._planterbox_profiler = self
+
+    def record(self, command, seconds, bytes_sent, bytes_received):
+        with self._lock:
+            record = self.current
+            if record is None:
+                record = self.unattributed
+            else:
+                by_command = record['by_command']
+                by_command[command] = by_command.get(command, 0) + 1
+            record['commands'] += 1
+            record['seconds'] += seconds
+            record['bytes_sent'] += bytes_sent
+            record['bytes_received'] += bytes_received
+
+    def start_step(self, feature, scenario, step, definition):
+        with self._lock:
+            if self.current is not None:
+                self.steps.append(self.current)
+            self.current = dict(
+                new_totals(),
+                feature=feature,
+                scenario=scenario,
+                step=step,
+                definition=definition,
+                by_command={},
+            )
+
+    def stop_step(self):
+        """Finish the running step and return its record."""
+        with self._lock:
+            record, self.current = self.current, None
+            if record is not None:
+                self.steps.append(record)
+            return record
+
+    def summary(self):
+        """Totals per feature, scenario and step definition, and each step."""
+        with self._lock:
+            steps = list(self.steps)
+            unattributed = dict(self.unattributed)
+
+        totals = new_totals()
+        features = defaultdict(new_totals)
+        scenarios = defaultdict(new_totals)
+        definitions = defaultdict(lambda: dict(new_totals(), calls=0))
+        for record in steps:
+            add_totals(totals, record)
+            add_totals(features[record['feature']], record)
+            add_totals(
+                scenarios['{}: {}'.format(record['feature'],
+                                          record['scenario'])],
+                record,
+            )
+            definition = definitions[record['definition']]
+            add_totals(definition, record)
+            definition['calls'] += 1
+
+        return {
+            'totals': totals,
+            'unattributed': unattributed,
+            'features': features,
+            'scenarios': scenarios,
+            'definitions': definitions,
+            'steps': sorted(steps, key=lambda record: -record['commands']),
+        }
+
+
+_profiler = CommandProfiler()
+
+
+def get_profiler():
+    return _profiler
+
+
+@hook('before', 'step')
+def profile_step_start(test):
+    browser = getattr(test, 'browser', None)
+    if browser is not None:
+        _profiler.instrument(browser)
+    _profiler.start_step(
+        feature=test.feature_path,
+        scenario=test.scenario_name,
+        step=test.step,
+        definition=test.step_function.__name__,
+    )
+
+
+@hook('after', 'step')
+def profile_step_stop(test):
+    record = _profiler.stop_step()
+    budget = config_option(test, 'profile.step-budget')
+    if record is None or not budget or record['commands'] <= int(budget):
+        return
+
+    message = 'Step "{}" issued {} WebDriver commands (budget {})'.format(
+        record['step'], record['commands'], budget)
+    action = config_option(test, 'profile.budget-action', 'warn')
+    if action not in BUDGET_ACTIONS:
+        raise ValueError(action)
+    if action == 'fail':
+        raise StepBudgetExceeded(message)
+    log.warning(message)
+
+
+@hook('after', 'failure')
+@hook('after', 'error')
+def profile_step_abandon(test):
+    """Close the record of a step that didn't finish."""
+    _profiler.stop_step()
+
+
+@hook('after', 'feature')
+def write_profile(test):
+    path = worker_path(
+        config_option(test, 'profile.output', DEFAULT_OUTPUT))
+    with open(path, 'w') as f:
+        json.dump(_profiler.summary(), f, indent=2, sort_keys=True)
@@ -0,0 +1,422 @@
+"""A local proxy that replays third-party responses and blocks hosts.
+
+Pages pull in analytics, fonts and CDN assets that have nothing to do with
+the assertions. Enable the proxy in unittest.cfg:
+
+    [planterbox]
+    proxy = true
+    proxy.block =
+        *.google-analytics.com
+        *.doubleclick.net
+    proxy.record =
+        cdn.example.com
+        *.fonts.example.net
+
+and browsers launched by planterbox_webdriver.factory send their requests
+through it. Requests to hosts matching a 'proxy.block' pattern are answered
+at once with an empty response. Plain HTTP GETs to hosts matching a
+'proxy.record' pattern are recorded in 'proxy.cache-dir' the first time and
+replayed from disk until they're 'proxy.max-age' seconds old; successful
+responses are only recorded if they set no cookies and allow caching.
+Everything else, including the application under test, goes to the network.
+HTTPS is tunnelled, since its responses can't be read, so it can only be
+blocked. Plain-HTTP requests are forwarded one at a time without their
+hop-by-hop headers, Upgrade included, so ws:// WebSockets can't connect
+through the proxy; wss:// ones are tunnelled like HTTPS. With
+'proxy.offline' set, anything not blocked or recorded fails at once instead
+of waiting on the network.
+
+Import the hooks to start the proxy with the first feature and log, after
+each feature, how many requests each host got and the time saved:
+
+    from planterbox_webdriver.proxy import (
+        report_proxy,
+        start_proxy,
+    )
+"""
+
+import atexit
+import base64
+from fnmatch import fnmatch
+import hashlib
+import json
+import os
+import os.path
+import select
+import socket
+import threading
+from time import time
+
+from planterbox import hook
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves import http_client
+from six.moves.urllib.parse import urlsplit
+
+from .config import (
+    config_flag,
+    config_option,
+)
+from .parallel import worker_path
+
+import logging
+log = logging.getLogger(__name__)
+
+
+__all__ = [
+    'report_proxy',
+    'start_proxy',
+]
+
+
+DEFAULT_CACHE_DIR = '.proxy-cache'
+
+DEFAULT_REPORT = 'planterbox-proxy.json'
+
+DEFAULT_TIMEOUT = 10
+
+# How long recorded responses are replayed for, in seconds.
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+# Cache-Control directives that mean a response mustn't be replayed.
+UNCACHEABLE = ('no-store', 'no-cache', 'private')
+
+# Headers that only apply to one connection, so aren't passed on.
+HOP_BY_HOP = frozenset([
+    'connection',
+    'keep-alive',
+    'proxy-authenticate',
+    'proxy-authorization',
+    'proxy-connection',
+    'te',
+    'trailers',
+    'transfer-encoding',
+    'upgrade',
+])
+
+
+class ResponseCache(object):
+    """Recorded responses on disk, one JSON file per method and URL."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, method, url):
+        key = hashlib.sha1(u'{} {}'.format(method, url).encode('utf-8'))
+        return os.path.join(self.directory, key.hexdigest() + '.json')
+
+    def get(self, method, url, max_age=None):
+        """The recorded response, unless it's missing or too old."""
+        try:
+            with open(self.path(method, url)) as f:
+                record = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if max_age is not None and time() - record['recorded'] > max_age:
+            return None
+        record['body'] = base64.b64decode(record['body'])
+        return record
+
+    def put(self, method, url, status, reason, headers, body, elapsed):
+        path = self.path(method, url)
+        temporary = '{}.{}.tmp'.format(path, threading.current_thread().ident)
+        with open(temporary, 'w') as f:
+            json.dump({
+                'url': url,
+                'status': status,
+                'reason': reason,
+                'headers': headers,
+                'body': base64.b64encode(body).decode('ascii'),
+                'elapsed': elapsed,
+                'recorded': time(),
+            }, f)
+        os.rename(temporary, path)
+
+
+class HostStats(object):
+    """Requests to each host, and what the proxy did with them."""
+
+    FIELDS = ('requests', 'replayed', 'fetched', 'blocked', 'tunnelled',
+              'failed')
+
+    def __init__(self):
+        self.hosts = {}
+        self._lock = threading.Lock()
+
+    def count(self, host, outcome, saved=0.0):
+        with self._lock:
+            stats = self.hosts.get(host)
+            if stats is None:
+                stats = self.hosts[host] = dict(
+                    (field, 0) for field in self.FIELDS)
+                stats['saved'] = 0.0
+            stats['requests'] += 1
+            stats[outcome] += 1
+            stats['saved'] += saved
+
+    def summary(self):
+        with self._lock:
+            return dict((host, dict(stats))
+                        for host, stats in self.hosts.items())
+
+
+class ProxyRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_CONNECT(self):
+        # Parsed as a URL's authority, so IPv6 hosts lose their brackets.
+        authority = urlsplit('//' + self.path)
+        host = authority.hostname or ''
+        proxy = self.server
+        if proxy.blocked(host):
+            proxy.stats.count(host, 'blocked')
+            self.reply(403)
+            return
+        if proxy.offline:
+            proxy.stats.count(host, 'failed')
+            self.reply(502)
+            return
+        try:
+            upstream = socket.create_connection((host, authority.port or 443),
+                                                proxy.timeout)
+        except (socket.error, ValueError):
+            proxy.stats.count(host, 'failed')
+            self.reply(502)
+            return
+
+        proxy.stats.count(host, 'tunnelled')
+        self.send_response(200, 'Connection Established')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            relay(self.connection, upstream)
+        finally:
+            upstream.close()
+
+    def do_GET(self):
+        self.forward()
+
+    def do_HEAD(self):
+        self.forward()
+
+    def do_POST(self):
+        self.forward()
+
+    def do_PUT(self):
+        self.forward()
+
+    def do_DELETE(self):
+        self.forward()
+
+    def do_OPTIONS(self):
+        self.forward()
+
+    def forward(self):
+        proxy = self.server
+        url = urlsplit(self.path)
+        host = url.hostname or ''
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+
+        if proxy.blocked(host):
+            proxy.stats.count(host, 'blocked')
+            self.reply(204)
+            return
+
+        cacheable = self.command == 'GET' and proxy.recorded(host)
+        record = cacheable and proxy.cache.get(self.command, self.path,
+                                               proxy.max_age)
+        if record:
+            proxy.stats.count(host, 'replayed', saved=record['elapsed'])
+            self.reply(record['status'], record['reason'],
+                       record['headers'], record['body'])
+            return
+        if proxy.offline:
+            proxy.stats.count(host, 'failed')
+            self.reply(504)
+            return
+
+        start = time()
+        try:
+            status, reason, headers, content = fetch(
+                self.command, url, self.headers, body, proxy.timeout)
+        except (socket.error, http_client.HTTPException):
+            log.debug('Could not fetch %s', self.path, exc_info=True)
+            proxy.stats.count(host, 'failed')
+            self.reply(502)
+            return
+        elapsed = time() - start
+
+        if cacheable and storable(status, headers):
+            proxy.cache.put(self.command, self.path, status, reason,
+                            headers, content, elapsed)
+        proxy.stats.count(host, 'fetched')
+        self.reply(status, reason, headers, content)
+
+    def reply(self, status, reason=None, headers=(), body=b''):
+        self.send_response(status, reason)
+        for name, value in headers:
+            name_lower = name.lower()
+            if name_lower not in HOP_BY_HOP and name_lower != 'content-length':
+                self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+def fetch(method, url, request_headers, body, timeout):
+    """Make a request upstream, returning its status, headers and body."""
+    connection = http_client.HTTPConnection(url.hostname, url.port or 80,
+                                            timeout=timeout)
+    try:
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        headers = dict(
+            (name, value) for name, value in request_headers.items()
+            if name.lower() not in HOP_BY_HOP
+        )
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        content = response.read()
+        return (response.status, response.reason,
+                [(name, value) for name, value in response.getheaders()
+                 if name.lower() not in HOP_BY_HOP],
+                content)
+    finally:
+        connection.close()
+
+
+def storable(status, headers):
+    """Whether a response can be replayed to later requests."""
+    if status != 200:
+        return False
+    for name, value in headers:
+        name = name.lower()
+        if name == 'set-cookie':
+            return False
+        if name == 'cache-control' and any(
+                directive in value.lower() for directive in UNCACHEABLE):
+            return False
+    return True
+
+
+def relay(client, upstream, idle_timeout=60):
+    """Copy bytes both ways between two sockets until either closes."""
+    sockets = [client, upstream]
+    while True:
+        readable, _, errored = select.select(sockets, [], sockets,
+                                             idle_timeout)
+        if errored or not readable:
+            return
+        for sock in readable:
+            data = sock.recv(65536)
+            if not data:
+                return
+            (upstream if sock is client else client).sendall(data)
+
+
+class CachingProxy(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """An HTTP proxy that replays recorded responses and blocks hosts."""
+
+    daemon_threads = True
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, blocked_hosts=(),
+                 recorded_hosts=(), max_age=DEFAULT_MAX_AGE, offline=False,
+                 timeout=DEFAULT_TIMEOUT, host='127.0.0.1', port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port),
+                                           ProxyRequestHandler)
+        self.cache = ResponseCache(cache_dir)
+        self.blocked_hosts = [pattern.lower() for pattern in blocked_hosts]
+        self.recorded_hosts = [pattern.lower() for pattern in recorded_hosts]
+        self.max_age = max_age
+        self.offline = offline
+        self.timeout = timeout
+        self.stats = HostStats()
+
+    @property
+    def address(self):
+        """The proxy's 'host:port', as browsers are configured with it."""
+        return '{}:{}'.format(*self.server_address[:2])
+
+    def blocked(self, host):
+        host = host.lower()
+        return any(fnmatch(host, pattern) for pattern in self.blocked_hosts)
+
+    def recorded(self, host):
+        host = host.lower()
+        return any(fnmatch(host, pattern) for pattern in self.recorded_hosts)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='proxy')
+        thread.daemon = True
+        thread.start()
+        log.info('Proxying browser requests through %s', self.address)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+_proxy = None
+
+
+def get_proxy(test):
+    """
+    The process-wide proxy if 'proxy' is enabled, started on first use.
+
+    Returns None if it isn't enabled.
+    """
+    global _proxy
+    if _proxy is None and config_flag(test, 'proxy'):
+        _proxy = CachingProxy(
+            cache_dir=config_option(test, 'proxy.cache-dir',
+                                    DEFAULT_CACHE_DIR),
+            blocked_hosts=config_option(test, 'proxy.block', '').split(),
+            recorded_hosts=config_option(test, 'proxy.record', '').split(),
+            max_age=float(config_option(test, 'proxy.max-age',
+                                        DEFAULT_MAX_AGE)),
+            offline=config_flag(test, 'proxy.offline'),
+            timeout=float(config_option(test, 'proxy.timeout',
+                                        DEFAULT_TIMEOUT)),
+        )
+        _proxy.start()
+        atexit.register(stop_proxy)
+    return _proxy
+
+
+def stop_proxy():
+    global _proxy
+    if _proxy is not None:
+        _proxy.stop()
+        _proxy = None
+
+
+def log_summary(summary):
+    for host, stats in sorted(summary.items(),
+                              key=lambda item: -item[1]['requests']):
+        log.info('%s: %d requests, %d replayed, %d blocked, %d failed, '
+                 '%.2fs saved', host, stats['requests'], stats['replayed'],
+                 stats['blocked'], stats['failed'], stats['saved'])
+
+
+@hook('before', 'feature')
+def start_proxy(test):
+    get_proxy(test)
+
+
+@hook('after', 'feature')
+def report_proxy(test):
+    if _proxy is None:
+        return
+    summary = _proxy.stats.summary()
+    log_summary(summary)
+    with open(worker_path(config_option(test, 'proxy.report',
+                                        DEFAULT_REPORT)), 'w') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
@@ -0,0 +1,203 @@
+"""Wait for a page to settle instead of sleeping for a fixed time.
+
+A page is idle once each of the READINESS_CHECKS holds:
+
+- document: document.readyState is 'complete'.
+- fonts: every web font has loaded.
+- animations: no finite CSS animation, transition or Web Animation is still
+  running. Infinite ones, like spinners, are ignored.
+- network: no fetch or XMLHttpRequest is pending. Requests are counted by
+  wrapping fetch and XMLHttpRequest, which is preloaded into new documents
+  where the driver supports it; otherwise only requests started after the
+  first wait are seen.
+
+The checks run in the browser every few milliseconds, so a wait costs one
+command for each ten seconds it lasts.
+"""
+
+from time import sleep, time
+
+from selenium.common.exceptions import (
+    JavascriptException,
+    TimeoutException,
+    WebDriverException,
+)
+
+from .config import config_option
+from .util import (
+    preload_script,
+    unsupported_command,
+)
+
+import logging
+log = logging.getLogger(__name__)
+
+
+READINESS_CHECKS = ('document', 'fonts', 'animations', 'network')
+
+DEFAULT_TIMEOUT = 15
+
+# How long the page must stay idle, in seconds, so that a request or
+# animation started straight after another finishes isn't missed.
+QUIET_PERIOD = 0.1
+
+IDLE_WAIT_CHUNK = 10
+
+NETWORK_TRACKER_SCRIPT = u"""
+(function () {
+    if (window.__planterboxPendingRequests !== undefined) {
+        return;
+    }
+    window.__planterboxPendingRequests = 0;
+    function started() {
+        window.__planterboxPendingRequests++;
+    }
+    function finished() {
+        window.__planterboxPendingRequests--;
+    }
+
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function () {
+            started();
+            return fetch.apply(this, arguments).then(function (response) {
+                finished();
+                return response;
+            }, function (error) {
+                finished();
+                throw error;
+            });
+        };
+    }
+
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        started();
+        this.addEventListener('loadend', finished);
+        try {
+            return send.apply(this, arguments);
+        } catch (e) {
+            this.removeEventListener('loadend', finished);
+            finished();
+            throw e;
+        }
+    };
+})();
+"""
+
+# busy(checks) lists the checks that don't hold yet.
+BUSY_SCRIPT = NETWORK_TRACKER_SCRIPT + u"""
+function running(animation) {
+    if (animation.playState !== 'running') {
+        return false;
+    }
+    var timing = animation.effect && animation.effect.getComputedTiming();
+    return !timing || timing.endTime !== Infinity;
+}
+
+var BUSY = {
+    document: function () {
+        return document.readyState !== 'complete';
+    },
+    fonts: function () {
+        return !!document.fonts && document.fonts.status !== 'loaded';
+    },
+    animations: function () {
+        return !!document.getAnimations &&
+            document.getAnimations().some(running);
+    },
+    network: function () {
+        return window.__planterboxPendingRequests > 0;
+    }
+};
+
+function busy(checks) {
+    return checks.filter(function (check) { return BUSY[check](); });
+}
+"""
+
+WAIT_FOR_IDLE_SCRIPT = BUSY_SCRIPT + u"""
+var checks = arguments[0], quiet = arguments[1] * 1000;
+var timeout = arguments[2] * 1000;
+var done = arguments[arguments.length - 1];
+var started = Date.now(), idleSince = null;
+
+function check() {
+    var now = Date.now(), waiting = busy(checks);
+    if (waiting.length) {
+        idleSince = null;
+    } else if (idleSince === null) {
+        idleSince = now;
+    }
+    if (idleSince !== null && now - idleSince >= quiet) {
+        done([]);
+    } else if (now - started >= timeout) {
+        done(waiting);
+    } else {
+        setTimeout(check, 20);
+    }
+}
+check();
+"""
+
+BUSY_NOW_SCRIPT = BUSY_SCRIPT + u"""
+return busy(arguments[0]);
+"""
+
+
+def readiness_timeout(test):
+    """How long steps wait for the page to be idle, 'readiness.timeout'."""
+    return float(config_option(test, 'readiness.timeout', DEFAULT_TIMEOUT))
+
+
+def track_requests(browser):
+    """Count fetch and XMLHttpRequests from the start of each new document."""
+    return preload_script(browser, 'network-tracker', NETWORK_TRACKER_SCRIPT)
+
+
+def wait_until_idle(browser, timeout=15, checks=READINESS_CHECKS,
+                    quiet=QUIET_PERIOD):
+    """
+    Wait until the page is idle by 'checks', for at most 'timeout' seconds.
+
+    Returns the checks that still didn't hold when the time ran out, so an
+    empty list means the page is idle.
+    """
+    checks = list(checks)
+    if 'network' in checks:
+        track_requests(browser)
+
+    start = time()
+    busy = checks
+    while True:
+        remaining = timeout - (time() - start)
+        try:
+            busy = browser.execute_async_script(
+                WAIT_FOR_IDLE_SCRIPT, checks, quiet,
+                max(0, min(IDLE_WAIT_CHUNK, remaining)),
+            )
+        except (JavascriptException, TimeoutException):
+            # The page navigated away mid-wait; check the new one.
+            pass
+        except WebDriverException as exc:
+            if not unsupported_command(exc):
+                raise
+            log.debug('No asynchronous scripts, polling for idle',
+                      exc_info=True)
+            return poll_until_idle(browser, timeout - (time() - start),
+                                   checks)
+        else:
+            if not busy:
+                return busy
+        if time() - start >= timeout:
+            return busy
+
+
+def poll_until_idle(browser, timeout, checks=READINESS_CHECKS):
+    """wait_until_idle for drivers that can't run asynchronous scripts."""
+    start = time()
+    while True:
+        busy = browser.execute_script(BUSY_NOW_SCRIPT, list(checks))
+        if not busy or time() - start >= timeout:
+            return busy
+        sleep(0.05)
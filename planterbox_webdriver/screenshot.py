@@ -1,6 +1,16 @@
 """Steps and utility functions for taking screenshots."""
 
+import atexit
+import base64
 from collections import defaultdict
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+import hashlib
+import io
+import itertools
+import threading
 import time
 import uuid
 
@@ -8,8 +18,23 @@ from planterbox import (
     hook,
     step,
 )
+import os
 import os.path
 import json
+import shutil
+
+from .config import config_option
+from .parallel import (
+    worker_id,
+)
+from .readiness import (
+    readiness_timeout,
+    wait_until_idle,
+)
+from .tracing import span
+
+import logging
+log = logging.getLogger(__name__)
 
 
 def resolution_path(test):
@@ -20,27 +45,250 @@ def resolution_path(test):
     )
 
 
+DEFAULT_WRITERS = 2
+
+DEFAULT_MAX_PENDING = 16
+
+
+class ScreenshotWriter(object):
+    """
+    Decodes and saves screenshots on background threads.
+
+    At most 'max_pending' screenshots are queued at once; beyond that,
+    submitting a screenshot waits for one to be written.
+    """
+
+    def __init__(self, workers=DEFAULT_WRITERS,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = []
+        self._directories = set()
+        self._lock = threading.Lock()
+
+    def submit(self, png_base64, directory, name=None, on_saved=None):
+        """
+        Queue a base64 encoded PNG to be saved in 'directory'.
+
+        Without a 'name', the screenshot is stored under the SHA-256 digest of
+        the PNG, and only written if that digest hasn't been stored yet.
+        'on_saved' is called with the name once the file is written.
+        Returns a future for the name the screenshot was saved as.
+        """
+        self._slots.acquire()
+        future = self._executor.submit(self._save, png_base64, directory,
+                                       name, on_saved)
+        future.add_done_callback(lambda future: self._slots.release())
+        with self._lock:
+            self._pending.append(future)
+        return future
+
+    def _save(self, png_base64, directory, name, on_saved):
+        with span('screenshot write', 'screenshot'):
+            name = self._write(png_base64, directory, name)
+        if on_saved is not None:
+            on_saved(name)
+        return name
+
+    def _write(self, png_base64, directory, name):
+        self._ensure_directory(directory)
+        png = base64.b64decode(png_base64)
+        if name is not None:
+            with open(os.path.join(directory, name), 'wb') as f:
+                f.write(png)
+            return name
+
+        name = '{}.png'.format(hashlib.sha256(png).hexdigest())
+        filename = os.path.join(directory, name)
+        if not os.path.exists(filename):
+            # Write and rename, so that an identical screenshot being saved
+            # at the same time never sees a partial file.
+            partial = '{}.{}.tmp'.format(filename, uuid.uuid4())
+            with open(partial, 'wb') as f:
+                f.write(png)
+            os.rename(partial, filename)
+        return name
+
+    def _ensure_directory(self, directory):
+        with self._lock:
+            if directory in self._directories:
+                return
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._directories.add(directory)
+
+    def flush(self):
+        """Wait for every queued screenshot, raising the first failure."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
+
+
+_writer = None
+
+
+def screenshot_writer(test):
+    """The process-wide screenshot writer, created from the test's config."""
+    global _writer
+    if _writer is None:
+        _writer = ScreenshotWriter(
+            workers=int(config_option(test, 'screenshot.writers',
+                                      DEFAULT_WRITERS)),
+            max_pending=int(config_option(test, 'screenshot.max-pending',
+                                          DEFAULT_MAX_PENDING)),
+        )
+        atexit.register(close_screenshot_writer)
+    return _writer
+
+
+def close_screenshot_writer():
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+class ReportStream(object):
+    """
+    Appends a line of JSON to a feature's report as each screenshot is saved.
+
+    Unlike the JSON report, records survive the process dying mid-feature
+    and can be followed while the feature runs. Records are written in the
+    order screenshots finish saving; each carries the order it was captured
+    in, which compact_report restores.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._file = io.open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+
+    def next_sequence(self):
+        """Numbers screenshots in the order they're captured."""
+        with self._lock:
+            return next(self._sequence)
+
+    def append(self, record):
+        line = json.dumps(record, sort_keys=True)
+        with self._lock:
+            self._file.write(u'{}\n'.format(line))
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def compact_report(stream_path):
+    """
+    Build a feature's JSON report from its streamed report.
+
+    Returns a dict of the screenshots taken in each scenario, as saved by
+    record_run_feature_report.
+    """
+    with io.open(stream_path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda record: (record.get('timestamp', 0),
+                                     record.get('sequence', 0)))
+    report = defaultdict(list)
+    for record in records:
+        report[record['scenario']].append(record['file'])
+    return report
+
+
+def feature_report_path(test, extension):
+    return os.path.join(
+        test.screenshot_path,
+        '{}.{}'.format(
+            os.path.splitext(os.path.basename(test.feature_path))[0],
+            extension,
+        ),
+    )
+
+
+def screenshot_stream(test):
+    """The feature's streamed report, if 'screenshot.report' is 'stream'."""
+    if config_option(test, 'screenshot.report', 'json') != 'stream':
+        return None
+    if getattr(test, 'screenshot_stream', None) is None:
+        test.screenshot_stream = ReportStream(
+            feature_report_path(test, 'jsonl'))
+    return test.screenshot_stream
+
+
 @step(r'I capture a screenshot$')
 def capture_screenshot(test):
-    shot_name = '{}.png'.format(uuid.uuid4())
-
     if getattr(test, 'screenshot_path', None) is None:
         test.screenshot_path = resolution_path(test)
 
-    if not os.path.isdir(test.screenshot_path):
-        os.makedirs(test.screenshot_path)
-    filename = os.path.join(
+    if config_option(test, 'screenshot.storage', 'uuid') == 'digest':
+        shot_name = None
+    else:
+        shot_name = '{}.png'.format(uuid.uuid4())
+
+    started = time.time()
+    png_base64 = test.browser.get_screenshot_as_base64()
+    latency = time.time() - started
+
+    stream = screenshot_stream(test)
+    on_saved = None
+    if stream is not None:
+        record = {
+            'feature': os.path.basename(test.feature_path),
+            'scenario': test.scenario_name,
+            'resolution': os.path.basename(test.screenshot_path),
+            'timestamp': started,
+            'sequence': stream.next_sequence(),
+            'latency': latency,
+        }
+        on_saved = lambda name: stream.append(dict(record, file=name))
+
+    # Only fetching the screenshot blocks the step; decoding and writing it
+    # happen in the background until record_run_feature_report.
+    saved = screenshot_writer(test).submit(
+        png_base64,
         test.screenshot_path,
         shot_name,
+        on_saved=on_saved,
     )
-    test.browser.get_screenshot_as_file(filename)
-    test.screenshot_report[test.scenario_name].append(shot_name)
+    if stream is None:
+        test.screenshot_report[test.scenario_name].append(shot_name or saved)
+
+
+def resolve_report(report):
+    """Replace the pending screenshots in a report with their names."""
+    for shots in report.values():
+        for i, shot in enumerate(shots):
+            if isinstance(shot, Future):
+                shots[i] = shot.result()
+
+
+def capture_when_idle(test, timeout):
+    """Capture once the page is idle, waiting at most 'timeout' seconds."""
+    busy = wait_until_idle(test.browser, timeout=timeout)
+    if busy:
+        log.warning('Capturing a screenshot of a page still busy with %s',
+                    ', '.join(busy))
+    capture_screenshot(test)
 
 
 @step(r'I capture a screenshot after (\d+) seconds?$')
 def capture_screenshot_delay(test, delay):
-    time.sleep(int(delay))
-    capture_screenshot(test)
+    """Capture once the page is idle, waiting at most 'delay' seconds."""
+    capture_when_idle(test, int(delay))
+
+
+@step(r'I capture a screenshot when the page is idle$')
+def capture_screenshot_idle(test):
+    capture_when_idle(test, readiness_timeout(test))
 
 
 @hook('before', 'feature')
@@ -54,6 +302,9 @@ def set_save_directory(test):
         test.config['start_date'][0],
         test.config['screenshot.source'][0],
     )
+    if worker_id() is not None:
+        # Merged back into root when a parallel run finishes
+        root = os.path.join(root, worker_id())
 
     if not os.path.isdir(root):
         os.makedirs(root)
@@ -64,16 +315,65 @@ def set_save_directory(test):
 
 @hook('after', 'feature')
 def record_run_feature_report(test):
-    if getattr(test, 'screenshot_report', None):
-        feature_name_json = '{}.json'.format(
-            os.path.splitext(os.path.basename(test.feature_path))[0]
-        )
-        feature_json_path = os.path.join(test.screenshot_path,
-                                         feature_name_json,
-                                         )
-        with open(feature_json_path, 'w') as f:
-            json.dump(test.screenshot_report, f)
+    stream = getattr(test, 'screenshot_stream', None)
+    if getattr(test, 'screenshot_report', None) or stream is not None:
+        screenshot_writer(test).flush()
+        if stream is not None:
+            stream.close()
+            report = compact_report(stream.path)
+            del test.screenshot_stream
+        else:
+            resolve_report(test.screenshot_report)
+            report = test.screenshot_report
+
+        with open(feature_report_path(test, 'json'), 'w') as f:
+            json.dump(report, f)
 
         del test.screenshot_report
         del test.screenshot_path
         del test.screenshot_root
+
+
+def merge_worker_screenshots(root):
+    """
+    Merge the screenshots saved by each worker of a parallel run into root.
+
+    Screenshots are moved into the matching resolution directory and the
+    per-feature reports are combined.
+    """
+    for worker in os.listdir(root):
+        worker_root = os.path.join(root, worker)
+        if not worker.startswith('worker-') or not os.path.isdir(worker_root):
+            continue
+        for resolution in os.listdir(worker_root):
+            source = os.path.join(worker_root, resolution)
+            destination = os.path.join(root, resolution)
+            if not os.path.isdir(destination):
+                os.makedirs(destination)
+            for filename in os.listdir(source):
+                if filename.endswith('.json'):
+                    merge_report(os.path.join(source, filename),
+                                 os.path.join(destination, filename))
+                elif filename.endswith('.jsonl'):
+                    merge_stream(os.path.join(source, filename),
+                                 os.path.join(destination, filename))
+                else:
+                    shutil.move(os.path.join(source, filename),
+                                os.path.join(destination, filename))
+        shutil.rmtree(worker_root)
+
+
+def merge_report(source, destination):
+    report = defaultdict(list)
+    for path in (destination, source):
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for scenario, shots in json.load(f).items():
+                    report[scenario].extend(shots)
+    with open(destination, 'w') as f:
+        json.dump(report, f)
+
+
+def merge_stream(source, destination):
+    with open(source, 'rb') as lines, open(destination, 'ab') as f:
+        shutil.copyfileobj(lines, f)
@@ -0,0 +1,311 @@
+"""Functions for cleaning up and reusing browser sessions between tests."""
+
+import hashlib
+from weakref import WeakKeyDictionary
+
+from planterbox import hook
+
+from six.moves.urllib.parse import urlsplit, urlunsplit
+
+from selenium.common.exceptions import (
+    NoAlertPresentException,
+    NoSuchWindowException,
+    UnexpectedAlertPresentException,
+    WebDriverException,
+)
+from selenium.webdriver.common.alert import Alert
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Clears the page's storage and reports what else needs resetting.
+RESET_PAGE_SCRIPT = u"""
+var state = {
+    framed: window !== window.top,
+    blank: location.href === 'about:blank',
+    web: location.protocol === 'http:' || location.protocol === 'https:',
+    origin: location.origin
+};
+try {
+    if (window.localStorage.length) {
+        window.localStorage.clear();
+    }
+    if (window.sessionStorage.length) {
+        window.sessionStorage.clear();
+    }
+} catch (e) {
+    // Storage isn't available on about: pages and some other documents
+}
+return state;
+"""
+
+
+# Loaded to set cookies and storage for an origin before restoring a state,
+# or to clear them when resetting.
+NEUTRAL_PATH = '/robots.txt'
+
+# The origins each driver has been sent to since it was last reset.
+_visited_origins = WeakKeyDictionary()
+
+
+def origin_of(url):
+    """The scheme, host and port of an http(s) URL, or None."""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        return None
+    return urlunsplit((parts.scheme, parts.netloc, '', '', ''))
+
+
+def neutral_url(url):
+    """
+    A static page on the same origin as 'url', where cookies and storage can
+    be set without the application running or redirecting.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        return url
+    return urlunsplit((parts.scheme, parts.netloc, NEUTRAL_PATH, '', ''))
+
+
+def remember_origin(browser, url):
+    """Note that the browser was sent to 'url', so its origin gets reset."""
+    origin = origin_of(url)
+    if origin is not None:
+        _visited_origins.setdefault(browser, set()).add(origin)
+
+
+def dismiss_alert(browser):
+    try:
+        Alert(browser).dismiss()
+    except NoAlertPresentException:
+        pass
+
+
+def reset_page(browser, handle):
+    """
+    Clear the top-level page's storage and return what else needs resetting.
+
+    Alerts and a frame left selected are only dealt with if the script meets
+    them, so a clean page costs a single command.
+    """
+    for attempt in range(3):
+        try:
+            state = browser.execute_script(RESET_PAGE_SCRIPT)
+        except UnexpectedAlertPresentException:
+            dismiss_alert(browser)
+        except NoSuchWindowException:
+            browser.switch_to.window(handle)
+        else:
+            if not state['framed']:
+                return state
+            browser.switch_to.default_content()
+    return browser.execute_script(RESET_PAGE_SCRIPT)
+
+
+def clear_cookies(browser, web_page):
+    """
+    Delete cookies for every origin where the driver can, otherwise for the
+    current page's.
+
+    HttpOnly cookies can't be seen from the page, and checking for them
+    costs as much as deleting them, so they're deleted unchecked.
+    """
+    if hasattr(browser, 'execute_cdp_cmd'):
+        try:
+            browser.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            return
+        except WebDriverException:
+            log.debug('Could not clear cookies over CDP', exc_info=True)
+    if web_page:
+        browser.delete_all_cookies()
+
+
+def clear_origins(browser, origins):
+    """
+    Clear the cookies and storage of origins other than the current page's.
+
+    Uses CDP's Storage.clearDataForOrigin where the driver has it. Otherwise
+    each origin's neutral page is loaded to clear them from there, and this
+    returns True since the browser has navigated.
+    """
+    if not origins:
+        return False
+    if hasattr(browser, 'execute_cdp_cmd'):
+        try:
+            for origin in sorted(origins):
+                browser.execute_cdp_cmd('Storage.clearDataForOrigin',
+                                        {'origin': origin,
+                                         'storageTypes': 'all'})
+            return False
+        except WebDriverException:
+            log.debug('Could not clear storage over CDP', exc_info=True)
+    for origin in sorted(origins):
+        try:
+            browser.get(neutral_url(origin))
+            browser.execute_script(RESET_PAGE_SCRIPT)
+            browser.delete_all_cookies()
+        except WebDriverException:
+            log.warning('Could not clear cookies and storage for %s; they '
+                        'may leak into the next scenario', origin,
+                        exc_info=True)
+    return True
+
+
+def reset_session(browser):
+    """
+    Return a browser to a blank state in as few commands as possible.
+
+    Closes every window but the first, dismisses any alert, clears the cookies
+    and storage and navigates to about:blank, skipping whatever's already
+    clean.
+
+    Storage is cleared for the current page's origin and for every origin
+    loaded with the visit step or a restored state since the last reset.
+    Origins only reached by following links, redirects or in frames are
+    not tracked: where the driver supports CDP their cookies are still
+    cleared, but their local storage is not, and without CDP neither is.
+    CDP can't clear session storage, so other origins' session storage
+    survives in the window on Chromium.
+    """
+    handles = browser.window_handles
+    if len(handles) > 1:
+        for handle in handles[1:]:
+            browser.switch_to.window(handle)
+            browser.close()
+        browser.switch_to.window(handles[0])
+
+    state = reset_page(browser, handles[0])
+    clear_cookies(browser, state['web'])
+    origins = _visited_origins.pop(browser, set())
+    origins.discard(state.get('origin'))
+    navigated = clear_origins(browser, origins)
+    if navigated or not state['blank']:
+        browser.get('about:blank')
+
+
+@hook('before', 'scenario')
+def reset_browser(test):
+    reset_session(test.browser)
+
+
+SNAPSHOT_STORAGE_SCRIPT = u"""
+function copy(storage) {
+    var items = {};
+    for (var i = 0; i < storage.length; i++) {
+        var key = storage.key(i);
+        items[key] = storage.getItem(key);
+    }
+    return items;
+}
+try {
+    return {
+        local: copy(window.localStorage),
+        session: copy(window.sessionStorage)
+    };
+} catch (e) {
+    return {local: {}, session: {}};
+}
+"""
+
+RESTORE_STORAGE_SCRIPT = u"""
+function restore(storage, items) {
+    storage.clear();
+    for (var key in items) {
+        storage.setItem(key, items[key]);
+    }
+}
+restore(window.localStorage, arguments[0].local);
+restore(window.sessionStorage, arguments[0].session);
+"""
+
+STEP_KEYWORDS = ('given', 'and', 'when', 'then', 'but')
+
+# Snapshots of prepared states by name, as (fingerprint, snapshot).
+_states = {}
+
+
+def snapshot_state(browser):
+    """The current page's URL, cookies and local and session storage."""
+    return {
+        'url': browser.current_url,
+        'cookies': browser.get_cookies(),
+        'storage': browser.execute_script(SNAPSHOT_STORAGE_SCRIPT),
+    }
+
+
+def restore_state(browser, snapshot):
+    """
+    Put a snapshot's cookies and storage back, then load its page.
+
+    Cookies and storage can only be set for the origin of the current page,
+    so a static page on that origin is loaded first.
+    """
+    remember_origin(browser, snapshot['url'])
+    browser.get(neutral_url(snapshot['url']))
+    browser.delete_all_cookies()
+    for cookie in snapshot['cookies']:
+        browser.add_cookie(cookie)
+    browser.execute_script(RESTORE_STORAGE_SCRIPT, snapshot['storage'])
+    browser.get(snapshot['url'])
+
+
+def setup_steps(steps):
+    """The lines of a multiline step, each starting with a step keyword."""
+    lines = []
+    for line in steps.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if line.split(None, 1)[0].lower() not in STEP_KEYWORDS:
+            line = u'Given ' + line
+        lines.append(line)
+    return lines
+
+
+def state_fingerprint(test, lines):
+    """Identifies a set of setup steps as run by a test module's steps."""
+    digest = hashlib.sha1(test.__module__.encode('utf-8'))
+    for line in lines:
+        digest.update(b'\n' + line.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def run_steps(test, lines):
+    """Run steps within another step. Step hooks aren't run for them."""
+    for line in lines:
+        step_fn, step_arguments = test.match_step(line)
+        if isinstance(step_arguments, dict):
+            step_fn(test, **step_arguments)
+        else:
+            step_fn(test, *step_arguments)
+
+
+def prepare_state(test, name, steps):
+    """
+    Run some setup steps once, then restore the state they left behind.
+
+    The first time a state is used in a process its steps are run and the
+    page's cookies and storage are saved. Later scenarios restore them
+    instead, unless the steps have changed.
+    """
+    lines = setup_steps(steps)
+    fingerprint = state_fingerprint(test, lines)
+    saved = _states.get(name)
+    if saved is not None and saved[0] == fingerprint:
+        try:
+            restore_state(test.browser, saved[1])
+        except WebDriverException:
+            log.info('Could not restore the "%s" state, preparing it again',
+                     name, exc_info=True)
+        else:
+            log.debug('Restored the "%s" state', name)
+            return
+
+    _states.pop(name, None)
+    run_steps(test, lines)
+    _states[name] = (fingerprint, snapshot_state(test.browser))
+
+
+def forget_states():
+    _states.clear()
@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from planterbox_webdriver.css_selector_steps import (
+    query_selector,
+    wait_for_elem,
+)
+
+
+@patch('planterbox_webdriver.css_selector_steps.query_jquery',
+       return_value=['jquery'])
+class TestQuerySelector(TestCase):
+    def test_native_results(self, query_jquery):
+        browser = Mock()
+        browser.execute_script.return_value = {'elements': ['native']}
+
+        self.assertEqual(query_selector(browser, 'div.native',
+                                        engine='auto'), ['native'])
+        query_jquery.assert_not_called()
+
+    def test_falls_back_to_jquery_once_per_selector(self, query_jquery):
+        browser = Mock()
+        browser.execute_script.return_value = {'elements': None}
+
+        for _ in range(3):
+            self.assertEqual(query_selector(browser, 'div:has(a)',
+                                            engine='auto'), ['jquery'])
+
+        self.assertEqual(browser.execute_script.call_count, 1)
+        self.assertEqual(query_jquery.call_count, 3)
+
+    def test_native_engine_fails_after_one_command(self, query_jquery):
+        browser = Mock()
+        browser.execute_script.return_value = {'elements': None}
+
+        self.assertRaises(ValueError, wait_for_elem, browser,
+                          'div:nth(1)', engine='native')
+
+        self.assertEqual(browser.execute_script.call_count, 1)
+        query_jquery.assert_not_called()
@@ -0,0 +1,108 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from nose2.config import Config
+
+from selenium.webdriver import FirefoxOptions
+
+from planterbox_webdriver.factory import (
+    DriverFactory,
+    driver_factory,
+)
+
+
+def make_test(**options):
+    return Mock(config=Config([
+        (key.replace('_', '-'), value) for key, value in options.items()
+    ]))
+
+
+class TestDriverFactory(TestCase):
+    def test_reads_the_config(self):
+        factory = DriverFactory.from_config(make_test(**{
+            'browser': 'Chrome',
+            'browser.headless': 'true',
+            'browser.page_load_strategy': 'eager',
+            'browser.window_size': '1280x800',
+            'browser.implicit_wait': '0',
+        }))
+
+        self.assertEqual(factory.browser, 'chrome')
+        self.assertTrue(factory.headless)
+        self.assertFalse(factory.block_images)
+        self.assertEqual(factory.page_load_strategy, 'eager')
+        self.assertEqual(factory.window_size, (1280, 800))
+        self.assertEqual(factory.implicit_wait, 0)
+        self.assertIsNone(factory.script_timeout)
+
+    def test_defaults_to_a_plain_firefox(self):
+        factory = DriverFactory.from_config(Mock(config=None))
+        options = factory.options()
+
+        self.assertEqual(factory.browser, 'firefox')
+        self.assertEqual(options.arguments, [])
+        self.assertEqual(options.preferences, FirefoxOptions().preferences)
+        self.assertEqual(options.page_load_strategy, 'normal')
+
+    def test_rejects_unknown_settings(self):
+        self.assertRaises(ValueError, DriverFactory, browser='lynx')
+        self.assertRaises(ValueError, DriverFactory,
+                          page_load_strategy='lazy')
+
+    def test_firefox_options(self):
+        options = DriverFactory(
+            headless=True, page_load_strategy='none', block_images=True,
+            block_fonts=True, disable_animations=True, window_size=(800, 600),
+            script_timeout=5,
+        ).options()
+
+        self.assertEqual(options.arguments,
+                         ['-headless', '--width=800', '--height=600'])
+        preferences = FirefoxOptions().preferences
+        preferences.update({
+            'permissions.default.image': 2,
+            'gfx.downloadable_fonts.enabled': False,
+            'ui.prefersReducedMotion': 1,
+        })
+        self.assertEqual(options.preferences, preferences)
+        self.assertEqual(options.page_load_strategy, 'none')
+        self.assertEqual(options.timeouts, {'script': 5000})
+
+    def test_chrome_options(self):
+        options = DriverFactory(
+            browser='chrome', headless=True, block_images=True,
+            disable_animations=True, window_size=(800, 600),
+        ).options()
+
+        self.assertEqual(options.arguments, [
+            '--headless=new',
+            '--window-size=800,600',
+            '--force-prefers-reduced-motion',
+        ])
+        self.assertEqual(
+            options.experimental_options['prefs'],
+            {'profile.managed_default_content_settings.images': 2})
+
+    @patch('planterbox_webdriver.factory.preload_script', return_value=True)
+    def test_blocks_fonts_and_animations_after_starting(self, preload):
+        factory = DriverFactory(browser='chrome', block_fonts=True,
+                                disable_animations=True)
+        driver = Mock()
+
+        with patch.object(factory, 'launch', return_value=driver):
+            self.assertIs(factory(), driver)
+
+        driver.execute_cdp_cmd.assert_called_with(
+            'Network.setBlockedURLs',
+            {'urls': ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot']})
+        self.assertEqual(preload.call_args[0][:2],
+                         (driver, 'disable-animations'))
+
+    def test_pool_factory_overrides(self):
+        factory = driver_factory(make_test(**{
+            'pool.factory': 'selenium.webdriver.Chrome'}))
+
+        from selenium.webdriver import Chrome
+        self.assertIs(factory, Chrome)
+        self.assertIsInstance(driver_factory(make_test()), DriverFactory)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import os.path
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.request import Request, urlopen
+
+from planterbox_webdriver.fixture_server import FixtureServer
+from planterbox_webdriver.webdriver import lookup_url
+
+
+class TestFixtureServer(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        with io.open(os.path.join(self.directory, 'page.html'), 'w',
+                     encoding='utf-8') as f:
+            f.write(u'<p>Fixture ✓</p>' * 100)
+
+        self.server = FixtureServer(self.directory,
+                                    cache_control='max-age=60')
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def get(self, path, **headers):
+        return urlopen(Request(self.server.url(path), headers=headers))
+
+    def test_registers_pages(self):
+        self.assertEqual(self.server.pages(),
+                         {'page': self.server.url('page.html')})
+
+    def test_serves_with_etag_and_cache_control(self):
+        response = self.get('page.html')
+
+        self.assertEqual(response.read().decode('utf-8'),
+                         u'<p>Fixture ✓</p>' * 100)
+        self.assertEqual(response.headers['Cache-Control'], 'max-age=60')
+        self.assertEqual(response.headers['Content-Type'],
+                         'text/html; charset=utf-8')
+
+        with self.assertRaises(HTTPError) as raised:
+            self.get('page.html',
+                     **{'If-None-Match': response.headers['ETag']})
+        self.assertEqual(raised.exception.code, 304)
+
+    def test_compresses_when_accepted(self):
+        response = self.get('page.html', **{'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        body = gzip.GzipFile(fileobj=io.BytesIO(response.read())).read()
+        self.assertEqual(body.decode('utf-8'), u'<p>Fixture ✓</p>' * 100)
+
+    def test_stays_inside_its_directory(self):
+        with self.assertRaises(HTTPError) as raised:
+            self.get('../' + os.path.basename(self.directory) + '/missing')
+        self.assertEqual(raised.exception.code, 404)
+
+
+class TestLookupUrl(TestCase):
+    @patch('planterbox_webdriver.webdriver._module_pages', {})
+    def test_imports_each_module_once(self):
+        test = Mock(spec=['__module__'])
+        test.__module__ = 'planterbox_webdriver.tests.html_pages'
+
+        with patch('planterbox_webdriver.webdriver.import_module',
+                   return_value=Mock(PAGES={'home': 'http://home/'})) as imp:
+            self.assertEqual(lookup_url(test, 'home'), 'http://home/')
+            self.assertEqual(lookup_url(test, 'http://x/'), 'http://x/')
+
+        imp.assert_called_once_with('planterbox_webdriver.tests.html_pages')
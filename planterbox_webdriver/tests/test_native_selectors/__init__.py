@@ -0,0 +1,21 @@
+from ..html_pages import PAGES
+from planterbox import (
+    hook,
+)
+from planterbox_webdriver.css_selector_steps import *
+from planterbox_webdriver.webdriver import visit
+from ..test_webdriver import (
+    create_webdriver,
+    quit_webdriver,
+    reset_browser,
+)
+
+
+@hook('before', 'feature')
+def use_native_selectors(test):
+    test.config._mvd['selector.engine'] = ['native']
+
+
+@hook('after', 'feature')
+def restore_selector_engine(test):
+    del test.config._mvd['selector.engine']
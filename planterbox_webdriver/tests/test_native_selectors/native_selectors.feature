@@ -0,0 +1,23 @@
+Feature: Native selector engine
+    Scenario: Plain CSS and shimmed jQuery extensions
+        When I visit "basic_page"
+        Then There should be an element matching $("textarea[name='bio']")
+        And There should be an element matching $("div:contains('Hello there!')")
+        And There should be exactly 2 elements matching $("input:radio")
+        And There should not be an element matching $("#hidden_text:visible")
+        And There should be an element matching $("#fav_colors option:eq(1):selected")
+        And There should be exactly 1 elements matching $("form label:first")
+
+    Scenario: Forms without jQuery
+        When I visit "basic_page"
+        Then I fill in $("input[name='user']") with "A test string"
+        And I check $("input[value='Bike']")
+        And $("input[value='Bike']") should be selected
+        And There should be an element matching $("#somediv:visible") within 1 second
+
+    Scenario: Submit and reset buttons
+        When I visit "button_page"
+        Then There should be exactly 3 elements matching $("form :submit")
+        And There should be an element matching $("button:submit:contains('Default')")
+        And There should be exactly 2 elements matching $(":reset")
+        And There should be an element matching $("button:reset")
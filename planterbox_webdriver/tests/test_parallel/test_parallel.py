@@ -0,0 +1,65 @@
+from json import dump, load
+import os
+import os.path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, TestSuite
+
+from planterbox_webdriver.parallel import schedule
+from planterbox_webdriver.screenshot import merge_worker_screenshots
+
+
+class FakeFeature(TestCase):
+    def __init__(self, feature_id):
+        super(FakeFeature, self).__init__('run_feature')
+        self.feature_id = feature_id
+
+    def id(self):
+        return self.feature_id
+
+    def run_feature(self):
+        pass
+
+
+class TestSchedule(TestCase):
+    def test_longest_and_unknown_first(self):
+        suite = TestSuite([
+            FakeFeature('short'),
+            TestSuite([FakeFeature('long'), FakeFeature('new')]),
+        ])
+
+        scheduled = schedule(suite, {'short': 1.0, 'long': 30.0})
+
+        self.assertEqual([test.id() for test in scheduled],
+                         ['new', 'long', 'short'])
+
+
+class TestMergeWorkerScreenshots(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.root)
+
+    def write_worker(self, worker, shot, report):
+        path = os.path.join(self.root, worker, '800x600')
+        os.makedirs(path)
+        open(os.path.join(path, shot), 'w').close()
+        with open(os.path.join(path, 'feature.json'), 'w') as f:
+            dump(report, f)
+
+    def test_merges_reports_and_moves_screenshots(self):
+        self.write_worker('worker-1', 'a.png', {'Scenario: A': ['a.png']})
+        self.write_worker('worker-2', 'b.png', {'Scenario: B': ['b.png']})
+
+        merge_worker_screenshots(self.root)
+
+        self.assertEqual(os.listdir(self.root), ['800x600'])
+        merged = os.path.join(self.root, '800x600')
+        self.assertEqual(sorted(os.listdir(merged)),
+                         ['a.png', 'b.png', 'feature.json'])
+        with open(os.path.join(merged, 'feature.json')) as f:
+            self.assertEqual(load(f), {
+                'Scenario: A': ['a.png'],
+                'Scenario: B': ['b.png'],
+            })
@@ -0,0 +1,85 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from selenium.common.exceptions import WebDriverException
+
+from planterbox_webdriver.pool import DriverPool
+
+
+def make_driver():
+    driver = Mock()
+    driver.execute_script.return_value = 1
+    return driver
+
+
+@patch('planterbox_webdriver.pool.reset_session')
+class TestDriverPool(TestCase):
+    def test_reuses_released_sessions(self, reset_session):
+        pool = DriverPool(factory=Mock(side_effect=make_driver))
+
+        first = pool.acquire()
+        pool.release(first)
+        second = pool.acquire()
+
+        self.assertIs(first, second)
+        reset_session.assert_called_once_with(first)
+        self.assertEqual(pool.stats(), {'launches': 1, 'launches_avoided': 1})
+
+    def test_recycles_after_max_uses(self, reset_session):
+        pool = DriverPool(factory=Mock(side_effect=make_driver), max_uses=2)
+
+        first = pool.acquire()
+        pool.release(first)
+        pool.release(pool.acquire())
+        third = pool.acquire()
+
+        self.assertIsNot(first, third)
+        self.assertTrue(first.quit.called)
+        self.assertEqual(pool.launches, 2)
+
+    def test_discards_crashed_sessions(self, reset_session):
+        pool = DriverPool(factory=Mock(side_effect=make_driver))
+
+        first = pool.acquire()
+        pool.release(first)
+        first.execute_script.side_effect = WebDriverException('gone')
+        second = pool.acquire()
+
+        self.assertIsNot(first, second)
+        self.assertTrue(first.quit.called)
+
+    def test_discards_sessions_that_fail_to_reset(self, reset_session):
+        reset_session.side_effect = WebDriverException('gone')
+        pool = DriverPool(factory=Mock(side_effect=make_driver))
+
+        first = pool.acquire()
+        pool.release(first)
+
+        self.assertTrue(first.quit.called)
+        self.assertIsNot(pool.acquire(), first)
+
+    def test_close_quits_idle_sessions(self, reset_session):
+        pool = DriverPool(factory=Mock(side_effect=make_driver))
+        driver = pool.acquire()
+        pool.release(driver)
+
+        pool.close()
+
+        self.assertTrue(driver.quit.called)
+
+    def test_release_counts_uses_under_the_lock(self, reset_session):
+        pool = DriverPool(factory=Mock(side_effect=make_driver), max_uses=1)
+        driver = pool.acquire()
+        test = self
+
+        class LockedUses(dict):
+            def get(self, *args):
+                test.assertTrue(pool._lock.locked())
+                return dict.get(self, *args)
+
+        pool._uses = LockedUses(pool._uses)
+        pool.release(driver)
+
+        self.assertTrue(driver.quit.called)
+        self.assertNotIn(driver, pool._uses)
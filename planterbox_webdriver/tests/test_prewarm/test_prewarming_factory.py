@@ -0,0 +1,87 @@
+import threading
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from planterbox_webdriver.prewarm import PrewarmingFactory
+
+
+class SlowFactory(object):
+    """Launches numbered drivers, each waiting until it's allowed to start."""
+
+    def __init__(self):
+        self.launched = []
+        self.allowed = threading.Semaphore(0)
+
+    def allow(self, launches):
+        for _ in range(launches):
+            self.allowed.release()
+
+    def __call__(self):
+        self.allowed.acquire()
+        driver = Mock(name='driver {}'.format(len(self.launched)))
+        self.launched.append(driver)
+        return driver
+
+
+class TestPrewarmingFactory(TestCase):
+    def setUp(self):
+        self.launcher = SlowFactory()
+        self.factory = PrewarmingFactory(self.launcher, spares=1, max_age=60)
+        self.addCleanup(self.factory.close, timeout=1)
+        # Let any spares still waiting to launch finish.
+        self.addCleanup(self.launcher.allow, 10)
+
+    def test_hands_out_the_spare_started_in_the_background(self):
+        self.launcher.allow(2)
+        first = self.factory()
+        second = self.factory()
+
+        self.assertEqual(self.launcher.launched[:2], [first, second])
+        self.assertEqual(self.factory.prewarmed, 1)
+
+    def test_waits_for_a_spare_already_starting(self):
+        self.launcher.allow(1)
+        self.factory()
+        # The spare is launching; the next call waits for it.
+        threading.Timer(0.05, self.launcher.allowed.release).start()
+        self.factory()
+
+        self.assertEqual(len(self.launcher.launched), 2)
+        self.assertEqual(self.factory.prewarmed, 1)
+
+    def test_quits_expired_spares(self):
+        factory = PrewarmingFactory(self.launcher, spares=1, max_age=-1)
+        self.addCleanup(factory.close, timeout=1)
+        self.addCleanup(self.launcher.allow, 10)
+        self.launcher.allow(3)
+
+        factory()
+        second = factory()
+
+        spare = self.launcher.launched[1]
+        self.assertTrue(spare.quit.called)
+        self.assertIsNot(second, spare)
+        self.assertEqual(factory.prewarmed, 0)
+
+    def test_close_quits_spares_still_starting(self):
+        self.launcher.allow(1)
+        self.factory()
+        self.launcher.allow(1)
+
+        self.factory.close(timeout=1)
+
+        self.assertEqual(len(self.launcher.launched), 2)
+        self.assertTrue(self.launcher.launched[1].quit.called)
+
+    @patch('planterbox_webdriver.prewarm.log')
+    def test_launches_directly_if_a_spare_fails(self, log):
+        launch = Mock(side_effect=[Mock(), Exception('no browser'), Mock()])
+        factory = PrewarmingFactory(launch, spares=1)
+        self.addCleanup(factory.close, timeout=1)
+
+        factory()
+        driver = factory()
+
+        self.assertIsNotNone(driver)
+        self.assertTrue(log.warning.called)
@@ -0,0 +1,62 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from planterbox_webdriver.profiling import CommandProfiler
+
+
+def make_browser():
+    browser = Mock()
+    browser.command_executor.execute.return_value = {'value': 'ok'}
+    return browser
+
+
+class TestCommandProfiler(TestCase):
+    def test_attributes_commands_to_running_step(self):
+        profiler = CommandProfiler()
+        browser = make_browser()
+        profiler.instrument(browser)
+
+        profiler.start_step('a.feature', 'First', 'I click', 'click')
+        browser.command_executor.execute('findElements', {'using': 'xpath'})
+        browser.command_executor.execute('clickElement', {'id': '1'})
+        record = profiler.stop_step()
+        browser.command_executor.execute('deleteAllCookies', None)
+
+        self.assertEqual(record['commands'], 2)
+        self.assertEqual(record['by_command'],
+                         {'findElements': 1, 'clickElement': 1})
+        self.assertGreater(record['bytes_sent'], 0)
+        self.assertGreater(record['bytes_received'], 0)
+        self.assertEqual(profiler.unattributed['commands'], 1)
+
+    def test_instruments_each_browser_once(self):
+        profiler = CommandProfiler()
+        browser = make_browser()
+        profiler.instrument(browser)
+        profiler.instrument(browser)
+
+        profiler.start_step('a.feature', 'First', 'I click', 'click')
+        browser.command_executor.execute('clickElement', {'id': '1'})
+
+        self.assertEqual(profiler.stop_step()['commands'], 1)
+
+    def test_summarizes_per_feature_scenario_and_definition(self):
+        profiler = CommandProfiler()
+        browser = make_browser()
+        profiler.instrument(browser)
+
+        for scenario, commands in (('First', 1), ('Second', 3)):
+            profiler.start_step('a.feature', scenario, 'I click', 'click')
+            for _ in range(commands):
+                browser.command_executor.execute('clickElement', {})
+        profiler.stop_step()
+        summary = profiler.summary()
+
+        self.assertEqual(summary['totals']['commands'], 4)
+        self.assertEqual(summary['features']['a.feature']['commands'], 4)
+        self.assertEqual(
+            summary['scenarios']['a.feature: Second']['commands'], 3)
+        self.assertEqual(summary['definitions']['click']['calls'], 2)
+        self.assertEqual([step['commands'] for step in summary['steps']],
+                         [3, 1])
@@ -0,0 +1,127 @@
+import io
+import os.path
+import shutil
+import tempfile
+from unittest import TestCase
+
+from six.moves import http_client
+
+from planterbox_webdriver.factory import DriverFactory
+from planterbox_webdriver.fixture_server import FixtureServer
+from planterbox_webdriver.proxy import (
+    CachingProxy,
+    storable,
+)
+
+
+class TestCachingProxy(TestCase):
+    def setUp(self):
+        pages = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pages)
+        with io.open(os.path.join(pages, 'asset.js'), 'w') as f:
+            f.write(u'var recorded = true;')
+        self.upstream = FixtureServer(pages, cache_control='max-age=60')
+        self.upstream.start()
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def start_proxy(self, **kwargs):
+        proxy = CachingProxy(cache_dir=self.cache_dir, **kwargs)
+        proxy.start()
+        self.addCleanup(proxy.stop)
+        return proxy
+
+    def request(self, proxy, method, url):
+        host, port = proxy.server_address[:2]
+        connection = http_client.HTTPConnection(host, port, timeout=5)
+        self.addCleanup(connection.close)
+        connection.request(method, url)
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    def test_records_then_replays(self):
+        proxy = self.start_proxy(recorded_hosts=['127.0.0.1'])
+        url = self.upstream.url('asset.js')
+
+        self.assertEqual(self.request(proxy, 'GET', url),
+                         (200, b'var recorded = true;'))
+        self.upstream.stop()
+        self.assertEqual(self.request(proxy, 'GET', url),
+                         (200, b'var recorded = true;'))
+
+        stats = proxy.stats.summary()['127.0.0.1']
+        self.assertEqual((stats['requests'], stats['fetched'],
+                          stats['replayed']), (2, 1, 1))
+        self.assertGreater(stats['saved'], 0)
+
+    def test_passes_other_hosts_through_live(self):
+        self.addCleanup(self.upstream.stop)
+        proxy = self.start_proxy(recorded_hosts=['cdn.example.com'])
+        url = self.upstream.url('asset.js')
+
+        self.request(proxy, 'GET', url)
+        self.request(proxy, 'GET', url)
+
+        stats = proxy.stats.summary()['127.0.0.1']
+        self.assertEqual((stats['fetched'], stats['replayed']), (2, 0))
+        self.assertIsNone(proxy.cache.get('GET', url))
+
+    def test_skips_uncacheable_responses(self):
+        self.addCleanup(self.upstream.stop)
+        self.upstream.cache_control = 'no-store'
+        proxy = self.start_proxy(recorded_hosts=['127.0.0.1'])
+        url = self.upstream.url('asset.js')
+
+        self.request(proxy, 'GET', url)
+
+        self.assertIsNone(proxy.cache.get('GET', url))
+        self.assertFalse(storable(200, [('Set-Cookie', 'session=1')]))
+        self.assertFalse(storable(302, [('Location', '/login')]))
+        self.assertTrue(storable(200, [('Cache-Control', 'max-age=60')]))
+
+    def test_refetches_expired_responses(self):
+        self.addCleanup(self.upstream.stop)
+        proxy = self.start_proxy(recorded_hosts=['127.0.0.1'], max_age=0)
+        url = self.upstream.url('asset.js')
+
+        self.request(proxy, 'GET', url)
+        self.request(proxy, 'GET', url)
+
+        stats = proxy.stats.summary()['127.0.0.1']
+        self.assertEqual((stats['fetched'], stats['replayed']), (2, 0))
+
+    def test_blocks_hosts(self):
+        self.addCleanup(self.upstream.stop)
+        proxy = self.start_proxy(blocked_hosts=['*.Example.com'])
+
+        self.assertEqual(
+            self.request(proxy, 'GET', 'http://ads.example.com/track.js'),
+            (204, b''))
+        self.assertEqual(
+            self.request(proxy, 'CONNECT', 'fonts.example.com:443')[0], 403)
+        self.assertEqual(proxy.stats.summary()['ads.example.com']['blocked'],
+                         1)
+
+    def test_connect_strips_ipv6_brackets(self):
+        self.addCleanup(self.upstream.stop)
+        proxy = self.start_proxy(blocked_hosts=['::1'])
+
+        self.assertEqual(self.request(proxy, 'CONNECT', '[::1]:443')[0], 403)
+        self.assertEqual(proxy.stats.summary()['::1']['blocked'], 1)
+
+    def test_offline_fails_fast(self):
+        self.addCleanup(self.upstream.stop)
+        proxy = self.start_proxy(offline=True)
+
+        self.assertEqual(
+            self.request(proxy, 'GET', self.upstream.url('asset.js'))[0], 504)
+        self.assertEqual(
+            self.request(proxy, 'CONNECT', 'cdn.example.com:443')[0], 502)
+
+    def test_factory_points_browsers_at_the_proxy(self):
+        self.addCleanup(self.upstream.stop)
+        options = DriverFactory(proxy='127.0.0.1:8123').options()
+
+        self.assertEqual(options.proxy.http_proxy, '127.0.0.1:8123')
+        self.assertEqual(options.proxy.ssl_proxy, '127.0.0.1:8123')
@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from selenium.common.exceptions import (
+    InvalidSessionIdException,
+    JavascriptException,
+    WebDriverException,
+)
+
+from planterbox_webdriver.readiness import wait_until_idle
+
+
+class TestWaitUntilIdle(TestCase):
+    def test_returns_once_idle(self):
+        browser = Mock()
+        browser.execute_async_script.return_value = []
+
+        self.assertEqual(wait_until_idle(browser, timeout=5), [])
+        self.assertEqual(browser.execute_async_script.call_count, 1)
+
+    def test_reports_checks_still_busy(self):
+        browser = Mock()
+        browser.execute_async_script.return_value = ['network']
+
+        self.assertEqual(wait_until_idle(browser, timeout=0), ['network'])
+
+    def test_waits_again_after_navigation(self):
+        browser = Mock()
+        browser.execute_async_script.side_effect = [
+            JavascriptException('document unloaded'), [],
+        ]
+
+        self.assertEqual(wait_until_idle(browser, timeout=5), [])
+
+    def test_polls_without_asynchronous_scripts(self):
+        browser = Mock()
+        browser.execute_async_script.side_effect = WebDriverException()
+        browser.execute_script.side_effect = [['fonts'], []]
+
+        self.assertEqual(wait_until_idle(browser, timeout=5,
+                                         checks=('fonts',)), [])
+
+    def test_raises_other_driver_errors(self):
+        browser = Mock()
+        browser.execute_async_script.side_effect = \
+            InvalidSessionIdException()
+
+        self.assertRaises(InvalidSessionIdException, wait_until_idle,
+                          browser, timeout=5, checks=('fonts',))
+        browser.execute_script.assert_not_called()
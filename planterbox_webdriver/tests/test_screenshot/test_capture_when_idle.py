@@ -0,0 +1,21 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from planterbox_webdriver.screenshot import capture_screenshot_delay
+
+
+@patch('planterbox_webdriver.screenshot.log')
+@patch('planterbox_webdriver.screenshot.capture_screenshot')
+@patch('planterbox_webdriver.screenshot.wait_until_idle')
+class TestCaptureScreenshotDelay(TestCase):
+    def test_warns_when_the_page_is_still_busy(self, wait_until_idle,
+                                               capture_screenshot, log):
+        test = Mock()
+        wait_until_idle.return_value = ['animations']
+
+        capture_screenshot_delay(test, '2')
+
+        wait_until_idle.assert_called_once_with(test.browser, timeout=2)
+        self.assertEqual(log.warning.call_args[0][1], 'animations')
+        capture_screenshot.assert_called_once_with(test)
@@ -0,0 +1,65 @@
+import base64
+import json
+import os.path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from planterbox_webdriver.screenshot import (
+    ReportStream,
+    ScreenshotWriter,
+    compact_report,
+)
+
+
+class TestReportStream(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+        self.path = os.path.join(self.root, 'feature.jsonl')
+
+    def tearDown(self):
+        rmtree(self.root)
+
+    def test_appends_record_when_screenshot_is_saved(self):
+        stream = ReportStream(self.path)
+        writer = ScreenshotWriter(workers=2, max_pending=2)
+        try:
+            writer.submit(
+                base64.b64encode(b'png'),
+                self.root,
+                'a.png',
+                on_saved=lambda name: stream.append(
+                    {'scenario': 'First', 'file': name}),
+            )
+            writer.flush()
+        finally:
+            writer.close()
+            stream.close()
+
+        with open(self.path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records, [{'scenario': 'First', 'file': 'a.png'}])
+
+    def test_compacts_to_feature_report(self):
+        stream = ReportStream(self.path)
+        stream.append({'scenario': 'First', 'file': 'a.png'})
+        stream.append({'scenario': 'Second', 'file': 'b.png'})
+        stream.append({'scenario': 'First', 'file': 'c.png'})
+        stream.close()
+
+        self.assertEqual(compact_report(self.path), {
+            'First': ['a.png', 'c.png'],
+            'Second': ['b.png'],
+        })
+
+    def test_compacts_in_capture_order(self):
+        stream = ReportStream(self.path)
+        # The second screenshot finished saving first.
+        stream.append({'scenario': 'First', 'file': 'b.png',
+                       'timestamp': 10.0, 'sequence': 1})
+        stream.append({'scenario': 'First', 'file': 'a.png',
+                       'timestamp': 10.0, 'sequence': 0})
+        stream.close()
+
+        self.assertEqual(compact_report(self.path),
+                         {'First': ['a.png', 'b.png']})
@@ -0,0 +1,53 @@
+import base64
+import hashlib
+import os.path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from planterbox_webdriver.screenshot import ScreenshotWriter
+
+
+class TestScreenshotWriter(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+        self.writer = ScreenshotWriter(workers=2, max_pending=2)
+
+    def tearDown(self):
+        self.writer.close()
+        rmtree(self.root)
+
+    def test_writes_decoded_screenshots(self):
+        directory = os.path.join(self.root, '800x600')
+        names = ['{}.png'.format(i) for i in range(5)]
+        for i, name in enumerate(names):
+            self.writer.submit(
+                base64.b64encode('png {}'.format(i).encode('ascii')),
+                directory,
+                name,
+            )
+
+        self.writer.flush()
+
+        for i, name in enumerate(names):
+            with open(os.path.join(directory, name), 'rb') as f:
+                self.assertEqual(f.read(), 'png {}'.format(i).encode('ascii'))
+
+    def test_stores_duplicates_once_by_digest(self):
+        png = b'the same png'
+        digest_name = '{}.png'.format(hashlib.sha256(png).hexdigest())
+
+        saved = [
+            self.writer.submit(base64.b64encode(png), self.root)
+            for _ in range(3)
+        ]
+        self.writer.flush()
+
+        self.assertEqual([future.result() for future in saved],
+                         [digest_name] * 3)
+        self.assertEqual(os.listdir(self.root), [digest_name])
+
+    def test_flush_raises_write_failures(self):
+        self.writer.submit(b'not base64!', self.root, 'x.png')
+
+        self.assertRaises(Exception, self.writer.flush)
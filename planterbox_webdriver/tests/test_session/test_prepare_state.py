@@ -0,0 +1,85 @@
+from unittest import TestCase
+
+from mock import Mock, call
+
+from selenium.common.exceptions import WebDriverException
+
+from planterbox_webdriver.session import (
+    forget_states,
+    prepare_state,
+    RESTORE_STORAGE_SCRIPT,
+    setup_steps,
+)
+
+
+STEPS = u"""
+    I visit "login"
+    And I fill in "Username" with "bob"
+"""
+
+
+def make_test():
+    test = Mock()
+    test.__module__ = 'planterbox_webdriver.tests.test_session'
+    test.browser.current_url = 'http://localhost/home'
+    test.browser.get_cookies.return_value = [{'name': 'session',
+                                              'value': 'abc'}]
+    test.browser.execute_script.return_value = {'local': {'token': '1'},
+                                                'session': {}}
+    test.step_fn = Mock()
+    test.match_step.side_effect = lambda line: (test.step_fn, (line,))
+    return test
+
+
+class TestPrepareState(TestCase):
+    def setUp(self):
+        self.addCleanup(forget_states)
+
+    def test_adds_step_keywords(self):
+        self.assertEqual(setup_steps(STEPS), [
+            u'Given I visit "login"',
+            u'And I fill in "Username" with "bob"',
+        ])
+
+    def test_runs_steps_once_then_restores(self):
+        first = make_test()
+        prepare_state(first, 'signed in', STEPS)
+        self.assertEqual(first.step_fn.call_args_list, [
+            call(first, u'Given I visit "login"'),
+            call(first, u'And I fill in "Username" with "bob"'),
+        ])
+
+        second = make_test()
+        prepare_state(second, 'signed in', STEPS)
+
+        second.step_fn.assert_not_called()
+        self.assertEqual(second.browser.method_calls[:2], [
+            call.get('http://localhost/robots.txt'),
+            call.delete_all_cookies(),
+        ])
+        self.assertEqual(second.browser.method_calls[-1],
+                         call.get('http://localhost/home'))
+        second.browser.add_cookie.assert_called_once_with(
+            {'name': 'session', 'value': 'abc'})
+        second.browser.execute_script.assert_called_once_with(
+            RESTORE_STORAGE_SCRIPT,
+            {'local': {'token': '1'}, 'session': {}})
+        second.browser.refresh.assert_not_called()
+
+    def test_changed_steps_invalidate_the_snapshot(self):
+        prepare_state(make_test(), 'signed in', STEPS)
+
+        changed = make_test()
+        prepare_state(changed, 'signed in', STEPS + u'I press "Log in"\n')
+
+        self.assertEqual(changed.step_fn.call_count, 3)
+        changed.browser.add_cookie.assert_not_called()
+
+    def test_prepares_again_if_restoring_fails(self):
+        prepare_state(make_test(), 'signed in', STEPS)
+
+        broken = make_test()
+        broken.browser.get.side_effect = WebDriverException()
+        prepare_state(broken, 'signed in', STEPS)
+
+        self.assertEqual(broken.step_fn.call_count, 2)
@@ -0,0 +1,120 @@
+from unittest import TestCase
+
+from mock import Mock, call, patch
+
+from selenium.common.exceptions import UnexpectedAlertPresentException
+
+from planterbox_webdriver.session import (
+    remember_origin,
+    reset_session,
+)
+
+
+def make_browser(handles=('main',), **state):
+    browser = Mock(spec=['window_handles', 'switch_to', 'close',
+                         'execute_script', 'delete_all_cookies', 'get'])
+    browser.window_handles = list(handles)
+    page = {'framed': False, 'blank': False, 'web': True}
+    page.update(state)
+    browser.execute_script.return_value = page
+    return browser
+
+
+class TestResetSession(TestCase):
+    def test_clean_blank_page_costs_two_commands(self):
+        browser = make_browser(blank=True, web=False)
+
+        reset_session(browser)
+
+        browser.execute_script.assert_called_once()
+        browser.switch_to.window.assert_not_called()
+        browser.delete_all_cookies.assert_not_called()
+        browser.get.assert_not_called()
+
+    def test_resets_a_visited_page(self):
+        browser = make_browser()
+
+        reset_session(browser)
+
+        browser.delete_all_cookies.assert_called_once_with()
+        browser.get.assert_called_once_with('about:blank')
+
+    def test_closes_extra_windows(self):
+        browser = make_browser(handles=('main', 'popup'))
+
+        reset_session(browser)
+
+        self.assertEqual(browser.switch_to.window.call_args_list,
+                         [call('popup'), call('main')])
+        browser.close.assert_called_once_with()
+
+    def test_leaves_frames(self):
+        browser = make_browser()
+        browser.execute_script.side_effect = [
+            {'framed': True, 'blank': False, 'web': True},
+            {'framed': False, 'blank': False, 'web': True},
+        ]
+
+        reset_session(browser)
+
+        browser.switch_to.default_content.assert_called_once_with()
+
+    @patch('planterbox_webdriver.session.dismiss_alert')
+    def test_dismisses_alerts(self, dismiss_alert):
+        browser = make_browser()
+        browser.execute_script.side_effect = [
+            UnexpectedAlertPresentException(),
+            {'framed': False, 'blank': False, 'web': True},
+        ]
+
+        reset_session(browser)
+
+        dismiss_alert.assert_called_once_with(browser)
+        browser.get.assert_called_once_with('about:blank')
+
+    def test_clears_every_origins_cookies_over_cdp(self):
+        browser = make_browser(blank=True, web=False)
+        browser.execute_cdp_cmd = Mock()
+
+        reset_session(browser)
+
+        browser.execute_cdp_cmd.assert_called_once_with(
+            'Network.clearBrowserCookies', {})
+        browser.delete_all_cookies.assert_not_called()
+
+    def test_clears_visited_origins_by_loading_them(self):
+        browser = make_browser(origin='http://app.test')
+        remember_origin(browser, 'http://app.test/login')
+        remember_origin(browser, 'http://auth.test:8000/sso?next=/')
+
+        reset_session(browser)
+
+        self.assertEqual(browser.get.call_args_list, [
+            call('http://auth.test:8000/robots.txt'),
+            call('about:blank'),
+        ])
+        self.assertEqual(browser.delete_all_cookies.call_count, 2)
+
+    def test_clears_visited_origins_over_cdp(self):
+        browser = make_browser(blank=True, web=False, origin='null')
+        browser.execute_cdp_cmd = Mock()
+        remember_origin(browser, 'https://auth.test/sso')
+
+        reset_session(browser)
+
+        browser.execute_cdp_cmd.assert_called_with(
+            'Storage.clearDataForOrigin',
+            {'origin': 'https://auth.test', 'storageTypes': 'all'})
+        browser.get.assert_not_called()
+
+    def test_forgets_origins_once_reset(self):
+        browser = make_browser(blank=True, web=False)
+        remember_origin(browser, 'http://auth.test/')
+
+        reset_session(browser)
+        reset_session(browser)
+
+        self.assertEqual(browser.get.call_args_list, [
+            call('http://auth.test/robots.txt'),
+            call('about:blank'),
+        ])
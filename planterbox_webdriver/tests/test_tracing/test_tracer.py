@@ -0,0 +1,57 @@
+import json
+import os.path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from mock import Mock
+
+from planterbox_webdriver import tracing
+
+
+class TestTracer(TestCase):
+    def setUp(self):
+        tracing.stop_tracing()
+
+    def tearDown(self):
+        tracing.stop_tracing()
+
+    def test_spans_are_no_ops_until_tracing_starts(self):
+        self.assertIs(tracing.span('poll', 'wait'), tracing.NULL_SPAN)
+
+    def test_keeps_most_recent_events(self):
+        tracer = tracing.start_tracing(capacity=2)
+        for name in ('first', 'second', 'third'):
+            with tracing.span(name, 'wait'):
+                pass
+
+        self.assertEqual([event[0] for event in tracer.events],
+                         ['second', 'third'])
+
+    def test_records_webdriver_commands(self):
+        tracer = tracing.start_tracing()
+        browser = Mock()
+        tracing.instrument(browser)
+        tracing.instrument(browser)
+
+        browser.command_executor.execute('findElements', {})
+
+        self.assertEqual([event[:2] for event in tracer.events],
+                         [('findElements', 'webdriver')])
+
+    def test_saves_trace_event_json(self):
+        tracer = tracing.start_tracing()
+        with tracing.span('I click', 'step', scenario='First'):
+            pass
+        root = mkdtemp()
+        try:
+            path = os.path.join(root, 'trace.json')
+            tracer.save(path)
+            with open(path) as f:
+                events = json.load(f)['traceEvents']
+        finally:
+            rmtree(root)
+
+        self.assertEqual([event['ph'] for event in events], ['M', 'X'])
+        self.assertEqual(events[1]['name'], 'I click')
+        self.assertEqual(events[1]['args'], {'scenario': 'First'})
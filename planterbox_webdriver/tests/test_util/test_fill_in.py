@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.remote.webelement import WebElement
+
+from planterbox_webdriver.util import fill_in
+
+
+class TestFillIn(TestCase):
+    def setUp(self):
+        self.test = Mock(config=None)
+        self.element = Mock(spec=WebElement)
+
+    def test_types_by_default(self):
+        fill_in(self.test, self.element, 'value')
+
+        self.element.clear.assert_called_once_with()
+        self.element.send_keys.assert_called_once_with('value')
+        self.element.parent.execute_script.assert_not_called()
+
+    def test_sets_value_in_one_command(self):
+        self.element.parent.execute_script.return_value = True
+
+        fill_in(self.test, self.element, 'value', strategy='set')
+
+        self.assertEqual(self.element.parent.execute_script.call_count, 1)
+        self.element.send_keys.assert_not_called()
+
+    def test_types_into_fields_that_need_keystrokes(self):
+        self.element.parent.execute_script.return_value = False
+
+        fill_in(self.test, self.element, '1900/01/01', strategy='set',
+                date=True)
+
+        self.assertEqual(self.element.send_keys.call_args_list[0][0],
+                         (Keys.DELETE,))
+        self.element.send_keys.assert_called_with('1900/01/01')
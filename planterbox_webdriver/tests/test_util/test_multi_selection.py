@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from selenium.common.exceptions import NoSuchElementException
+
+from planterbox_webdriver.util import set_multi_selection
+
+
+class TestSetMultiSelection(TestCase):
+    def test_sets_selection_in_one_command(self):
+        browser = Mock()
+        browser.execute_script.return_value = {'error': None}
+
+        set_multi_selection(browser, ['red', 'Blue'])
+
+        self.assertEqual(browser.execute_script.call_count, 1)
+        self.assertEqual(browser.execute_script.call_args[0][1:],
+                         (None, ['red', 'Blue']))
+
+    def test_raises_like_select_for_missing_options(self):
+        browser = Mock()
+        browser.execute_script.return_value = {'error': 'missing',
+                                               'name': 'Mauve'}
+
+        self.assertRaises(NoSuchElementException,
+                          set_multi_selection, browser, ['Mauve'])
+
+    def test_raises_like_select_for_single_selects(self):
+        browser = Mock()
+        browser.execute_script.return_value = {'error': 'multiple'}
+
+        self.assertRaises(NotImplementedError,
+                          set_multi_selection, browser, ['red'])
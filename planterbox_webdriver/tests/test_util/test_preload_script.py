@@ -0,0 +1,42 @@
+import gc
+from unittest import TestCase
+
+from mock import Mock
+
+from selenium.common.exceptions import WebDriverException
+
+from planterbox_webdriver import util
+from planterbox_webdriver.util import preload_script
+
+
+class TestPreloadScript(TestCase):
+    def test_adds_each_script_once_per_driver(self):
+        browser = Mock()
+
+        self.assertTrue(preload_script(browser, 'script', 'var a;'))
+        self.assertTrue(preload_script(browser, 'script', 'var a;'))
+
+        browser.execute_cdp_cmd.assert_called_once_with(
+            'Page.addScriptToEvaluateOnNewDocument', {'source': 'var a;'})
+
+    def test_remembers_drivers_without_preload_scripts(self):
+        browser = Mock()
+        browser.execute_cdp_cmd.side_effect = WebDriverException()
+        source = Mock(return_value='var a;')
+
+        self.assertFalse(preload_script(browser, 'first', source))
+        self.assertFalse(preload_script(browser, 'second', source))
+
+        self.assertEqual(source.call_count, 1)
+
+    def test_forgets_drivers_that_are_gone(self):
+        gc.collect()
+        drivers = len(util._preloaded_scripts)
+        browser = Mock()
+        preload_script(browser, 'script', 'var a;')
+        self.assertIn(browser, util._preloaded_scripts)
+
+        del browser
+        gc.collect()
+
+        self.assertEqual(len(util._preloaded_scripts), drivers)
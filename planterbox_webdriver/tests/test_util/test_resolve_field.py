@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from planterbox_webdriver.util import resolve_field
+
+
+class TestResolveField(TestCase):
+    def test_searches_type_groups_in_one_command(self):
+        browser = Mock()
+        browser.execute_script.return_value = None
+
+        self.assertIsNone(
+            resolve_field(browser, (('date',), ('text', 'textarea')), 'dob'))
+
+        self.assertEqual(browser.execute_script.call_count, 1)
+        self.assertEqual(browser.execute_script.call_args[0][1:],
+                         ([['date'], ['text', 'textarea']], 'dob', None))
+
+    def test_counts_matches_at_the_same_precedence(self):
+        browser = Mock()
+        first, second = Mock(), Mock()
+        browser.execute_script.return_value = {
+            'elements': [first, second],
+            'type': 'text',
+            'value': '',
+            'displayed': True,
+            'enabled': True,
+        }
+
+        field = resolve_field(browser, (('text',),), 'name')
+
+        self.assertIs(field.element, first)
+        self.assertEqual(field.count, 2)
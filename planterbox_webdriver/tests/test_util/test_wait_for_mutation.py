@@ -0,0 +1,94 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from selenium.common.exceptions import (
+    JavascriptException,
+    NoSuchWindowException,
+    TimeoutException,
+    UnknownMethodException,
+    WebDriverException,
+)
+
+from planterbox_webdriver.util import (
+    wait_for_mutation,
+    XPATH_ELEMENTS_CONDITION,
+)
+
+
+class TestWaitForMutation(TestCase):
+    def test_returns_async_result(self):
+        browser = Mock()
+        browser.execute_async_script.return_value = ['elem']
+        fallback = Mock()
+
+        result = wait_for_mutation(browser, XPATH_ELEMENTS_CONDITION, '//a',
+                                   timeout=1, fallback=fallback)
+
+        self.assertEqual(result, ['elem'])
+        self.assertEqual(browser.execute_async_script.call_count, 1)
+        self.assertFalse(fallback.called)
+
+    def test_falls_back_after_navigation(self):
+        browser = Mock()
+        browser.execute_async_script.side_effect = JavascriptException(
+            'Document was unloaded')
+        fallback = Mock(return_value=True)
+
+        result = wait_for_mutation(browser, XPATH_ELEMENTS_CONDITION, '//a',
+                                   timeout=1, fallback=fallback)
+
+        self.assertTrue(result)
+        self.assertTrue(fallback.called)
+
+    def test_remembers_unsupported_browsers(self):
+        browser = Mock()
+        browser.execute_async_script.side_effect = UnknownMethodException()
+        fallback = Mock(return_value=True)
+
+        wait_for_mutation(browser, XPATH_ELEMENTS_CONDITION, '//a',
+                          timeout=1, fallback=fallback)
+        wait_for_mutation(browser, XPATH_ELEMENTS_CONDITION, '//a',
+                          timeout=1, fallback=fallback)
+
+        self.assertEqual(browser.execute_async_script.call_count, 1)
+        self.assertEqual(fallback.call_count, 2)
+
+    def test_remembers_unknown_commands(self):
+        browser = Mock()
+        browser.execute_async_script.side_effect = WebDriverException(
+            'unknown command')
+        fallback = Mock(return_value=True)
+
+        wait_for_mutation(browser, XPATH_ELEMENTS_CONDITION, '//a',
+                          timeout=1, fallback=fallback)
+        wait_for_mutation(browser, XPATH_ELEMENTS_CONDITION, '//a',
+                          timeout=1, fallback=fallback)
+
+        self.assertEqual(browser.execute_async_script.call_count, 1)
+
+    def test_script_timeouts_fall_back_only_once(self):
+        browser = Mock()
+        browser.execute_async_script.side_effect = TimeoutException()
+        fallback = Mock(return_value=True)
+
+        wait_for_mutation(browser, XPATH_ELEMENTS_CONDITION, '//a',
+                          timeout=1, fallback=fallback)
+        wait_for_mutation(browser, XPATH_ELEMENTS_CONDITION, '//a',
+                          timeout=1, fallback=fallback)
+
+        self.assertEqual(browser.execute_async_script.call_count, 2)
+        self.assertEqual(fallback.call_count, 2)
+
+    def test_raises_other_errors(self):
+        browser = Mock()
+        browser.execute_async_script.side_effect = NoSuchWindowException()
+        fallback = Mock(return_value=True)
+
+        for _ in range(2):
+            self.assertRaises(NoSuchWindowException, wait_for_mutation,
+                              browser, XPATH_ELEMENTS_CONDITION, '//a',
+                              timeout=1, fallback=fallback)
+
+        self.assertEqual(browser.execute_async_script.call_count, 2)
+        self.assertFalse(fallback.called)
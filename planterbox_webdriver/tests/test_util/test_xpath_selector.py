@@ -0,0 +1,141 @@
+from unittest import TestCase
+
+from mock import Mock
+
+from planterbox_webdriver.util import (
+    XPathSelector,
+    element_id_by_label,
+    evaluate_selectors,
+    find_option,
+    option_in_select,
+)
+
+
+class TestEvaluateSelectors(TestCase):
+    def test_evaluates_pending_selectors_in_one_command(self):
+        browser = Mock()
+        browser.execute_script.return_value = [['select'], [], ['option']]
+        select = XPathSelector(browser, './/select[@id="s"]')
+        missing = XPathSelector(browser, './/option[@id="o"]', context=select)
+        option = XPathSelector(browser, './/option[@name="o"]',
+                               context=select)
+
+        # The context is added to the batch ahead of its dependents.
+        evaluate_selectors([missing, option])
+
+        specs = browser.execute_script.call_args[0][1]
+        self.assertEqual([spec['context'] for spec in specs], [None, 0, 0])
+        self.assertEqual(browser.execute_script.call_count, 1)
+        self.assertEqual(list(select), ['select'])
+        self.assertEqual(list(missing), [])
+        self.assertEqual(list(option), ['option'])
+        browser.find_elements.assert_not_called()
+
+    def test_skips_evaluated_selectors(self):
+        browser = Mock()
+        evaluate_selectors([XPathSelector(browser, elements=['a'])])
+
+        browser.execute_script.assert_not_called()
+
+    def test_empty_context_selects_nothing(self):
+        browser = Mock()
+        browser.execute_script.return_value = [[]]
+        context = XPathSelector(browser, elements=[])
+
+        evaluate_selectors([XPathSelector(browser, './/option',
+                                          context=context)])
+
+        spec, = browser.execute_script.call_args[0][1]
+        self.assertEqual((spec['element'], spec['scoped']), (None, True))
+
+    def test_union_stays_pending(self):
+        browser = Mock()
+        union = XPathSelector(browser, '//a') + XPathSelector(browser, '//b')
+
+        self.assertTrue(union.pending)
+        self.assertEqual(union.xpath, '//a|//b')
+
+    def test_uses_slots(self):
+        selector = XPathSelector(Mock(), '//a')
+
+        self.assertRaises(AttributeError, setattr, selector, 'other', 1)
+
+
+class TestFindOption(TestCase):
+    def test_resolves_select_and_option_in_one_command(self):
+        browser = Mock()
+        # Select by id, name and label, then each select's options by id,
+        # name, label and contents.
+        browser.execute_script.return_value = (
+            [[], ['select'], []] +
+            [[]] * 4 + [[], [], ['label option'], ['contents']] + [[]] * 4
+        )
+
+        self.assertEqual(list(find_option(browser, 'Size', 'Large')),
+                         ['label option'])
+        self.assertEqual(browser.execute_script.call_count, 1)
+
+    def test_falls_back_to_first_option_by_contents(self):
+        browser = Mock()
+        browser.execute_script.return_value = (
+            [['select'], [], []] + [[], [], [], ['first', 'second']] +
+            [[]] * 8
+        )
+
+        self.assertEqual(find_option(browser, 'Size', 'Large'), 'first')
+
+    def test_two_selects_with_one_name_fail(self):
+        browser = Mock()
+        browser.execute_script.return_value = (
+            [[], ['first', 'second'], []] + [[]] * 12
+        )
+
+        self.assertRaises(AssertionError,
+                          find_option, browser, 'size', 'Large')
+
+    def test_two_selects_with_one_label_fail(self):
+        browser = Mock()
+        browser.execute_script.return_value = (
+            [[], [], ['first', 'second']] + [[]] * 12
+        )
+
+        self.assertRaises(AssertionError,
+                          option_in_select, browser, 'Size', 'Large')
+
+    def test_select_found_by_id_and_label(self):
+        browser = Mock()
+        browser.execute_script.return_value = (
+            [['select'], [], ['select']] + [[], [], ['option'], []] +
+            [[]] * 8
+        )
+
+        self.assertEqual(list(find_option(browser, 'size', 'Large')),
+                         ['option'])
+
+    def test_option_in_select(self):
+        browser = Mock()
+        browser.execute_script.return_value = [[], [], ['select'],
+                                               [], [], ['option']]
+
+        self.assertEqual(option_in_select(browser, 'Size', 'Large'),
+                         'option')
+
+
+class TestElementIdByLabel(TestCase):
+    def test_reads_label_and_for_in_one_command(self):
+        browser = Mock()
+        browser.execute_script.return_value = [['label'], ['username']]
+
+        self.assertEqual(element_id_by_label(browser, 'User "name"'),
+                         'username')
+        self.assertEqual(browser.execute_script.call_count, 1)
+        specs = browser.execute_script.call_args[0][1]
+        self.assertEqual(specs[0]['xpath'],
+                         u'//label[contains(., \'User "name"\')]')
+        browser.find_elements.assert_not_called()
+
+    def test_missing_label(self):
+        browser = Mock()
+        browser.execute_script.return_value = [[], []]
+
+        self.assertIs(element_id_by_label(browser, 'Missing'), False)
@@ -2,6 +2,7 @@ from ..html_pages import PAGES
 from planterbox import (
     hook,
 )
+from planterbox_webdriver.session import reset_browser
 from planterbox_webdriver.webdriver import *
 
 
@@ -9,8 +10,8 @@ from planterbox_webdriver.webdriver import *
 def create_webdriver(test):
     from planterbox_webdriver.monkeypatch import fix_inequality
     fix_inequality()
-    from selenium import webdriver
-    test.browser = webdriver.Firefox()
+    from planterbox_webdriver.factory import DriverFactory
+    test.browser = DriverFactory.from_config(test)()
 
 
 @hook('after', 'feature')
@@ -18,8 +19,3 @@ def quit_webdriver(test):
     global browser
     test.browser.quit()
     test.browser = None
-
-
-@hook('before', 'scenario')
-def reset_browser(test):
-    test.browser.get('about:home')
@@ -74,11 +74,44 @@ Feature: I exercise basic functionality of webdriver
         And I fill in "username" with "Danni"
         Then input "username" has value "Danni"
 
+    Scenario: Set input values without typing
+        When I go to "basic_page"
+        And I set "username" to "Danni"
+        Then input "username" has value "Danni"
+
+    Scenario: Type input values
+        When I go to "basic_page"
+        And I type "Danni" into "username"
+        Then input "username" has value "Danni"
+
+    Scenario: Set date input by typing
+        When I go to "basic_page"
+        And I set "dob" to "1900/01/01"
+        Then input "dob" has value "1900/01/01"
+
     Scenario: Test date input
         When I go to "basic_page"
         And I fill in "dob" with "1900/01/01"
         Then input "dob" has value "1900/01/01"
 
+    Scenario: Setting a value respects maxlength like typing
+        When I go to "dynamic_form"
+        And I set "Postcode" to "AB12 3CD"
+        Then input "code" has value "AB12"
+        When I type "EF34 5GH" into "Postcode"
+        Then input "code" has value "EF34"
+
+    Scenario: Fill in fields replaced or relabelled by script
+        When I go to "dynamic_form"
+        And I fill in "City" with "Leeds"
+        And I press "Replace the field"
+        And I fill in "City" with "York"
+        Then input "city" has value "York"
+        When I press "Relabel the field"
+        And I fill in "City" with "Hull"
+        Then input "town" has value "Hull"
+        And input "city" has value "York"
+
     Scenario: Checkboxes checked
         Given I go to "basic_page"
         When I check "I have a bike"
@@ -99,3 +99,30 @@ class TestFailures(TestCase):
         ]
         completed_steps = [s.strip() for s in feature_exc_info.completed_steps]
         self.assertEqual(completed_steps, expected_completed)
+
+    def test_ambiguous_fields_fail(self):
+        # Both "Username:" and "Password:" are labels containing "s".
+        feature_text = """Feature: I expect a step to fail.
+           Scenario: Ambiguous fields fail
+              Given I go to "basic_page"
+              When I fill in "s" with "Danni"
+        """
+
+        def captureFailure(*args):
+            self.failure = args
+
+        MyFeatureTestCase = transplant_class(FeatureTestCase, self.__module__)
+        feature_test = MyFeatureTestCase(
+            feature_path=__file__,
+            feature_text=feature_text,
+        )
+        feature_test.run(result=Mock(
+            addFailure=Mock(side_effect=captureFailure),
+            addError=Mock(side_effect=Exception),
+            addSuccess=Mock(side_effect=Exception),
+        ))
+        feature_exc_info = self.failure[1]
+        failstep = 'When I fill in "s" with "Danni"'
+        self.assertEqual(feature_exc_info.failed_step.strip(), failstep)
+        failname = 'Scenario: Ambiguous fields fail'
+        self.assertEqual(feature_exc_info.scenario_name.strip(), failname)
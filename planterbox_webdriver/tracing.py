@@ -0,0 +1,240 @@
+"""Record a timeline of steps and WebDriver commands in Chrome's trace format.
+
+Import the hooks into a feature's test module:
+
+    from planterbox_webdriver.tracing import *
+
+and spans for each feature, scenario, step, step lookup, WebDriver command,
+wait_for poll and screenshot write are kept in a ring buffer of the most
+recent 'trace.buffer-size' events. Nothing is written until the end of each
+feature, when the buffer is saved to 'trace.output' in the trace-event format
+read by Perfetto and chrome://tracing.
+"""
+
+from collections import deque
+import json
+import os
+import threading
+import time
+
+from planterbox import hook
+
+from six import text_type
+
+from .config import config_option
+from .parallel import worker_path
+
+import logging
+log = logging.getLogger(__name__)
+
+
+__all__ = [
+    'trace_feature_start',
+    'trace_feature_stop',
+    'trace_scenario_start',
+    'trace_scenario_stop',
+    'trace_step_start',
+    'trace_step_stop',
+]
+
+
+DEFAULT_OUTPUT = 'planterbox-trace.json'
+
+DEFAULT_BUFFER_SIZE = 100000
+
+
+class Tracer(object):
+    """
+    Keeps the most recent spans in memory.
+
+    Recording a span is a deque append; events are only converted to trace
+    JSON when they're saved.
+    """
+
+    def __init__(self, capacity=DEFAULT_BUFFER_SIZE):
+        self.events = deque(maxlen=capacity)
+        self.threads = {}
+        self.pid = os.getpid()
+
+    def record(self, name, category, start, duration, args=None):
+        thread = threading.current_thread()
+        if thread.ident not in self.threads:
+            self.threads[thread.ident] = thread.name
+        self.events.append(
+            (name, category, start, duration, thread.ident, args))
+
+    def trace_events(self):
+        """The buffered spans as a list of trace-event dicts."""
+        events = [
+            {
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': self.pid,
+                'tid': tid,
+                'args': {'name': name},
+            }
+            for tid, name in list(self.threads.items())
+        ]
+        for name, category, start, duration, tid, args in list(self.events):
+            event = {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': start * 1e6,
+                'dur': duration * 1e6,
+                'pid': self.pid,
+                'tid': tid,
+            }
+            if args:
+                event['args'] = args
+            events.append(event)
+        return events
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(),
+                       'displayTimeUnit': 'ms'},
+                      f, default=text_type)
+
+
+class Span(object):
+    """Times a block and records it when the block exits."""
+
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.category, self.start,
+                           time.time() - self.start, self.args)
+
+
+class NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+_tracer = None
+
+
+def get_tracer():
+    return _tracer
+
+
+def start_tracing(capacity=DEFAULT_BUFFER_SIZE):
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(capacity)
+    return _tracer
+
+
+def stop_tracing():
+    global _tracer
+    _tracer = None
+
+
+def span(name, category, **args):
+    """
+    A context manager recording a span, if tracing has been started.
+
+    When it hasn't, this returns a shared no-op context manager.
+    """
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(_tracer, name, category, args)
+
+
+def instrument(browser):
+    """Record a span for each command sent through a browser."""
+    executor = browser.command_executor
+    if getattr(executor, '_planterbox_traced', False) is True:
+        return
+    execute = executor.execute
+
+    def traced_execute(command, params=None):
+        with span(command, 'webdriver'):
+            return execute(command, params)
+
+    executor.execute = traced_execute
+    executor._planterbox_traced = True
+
+
+def instrument_match_step(test):
+    """Record the time spent matching each step to its definition."""
+    if getattr(test, '_planterbox_traced', False) is True:
+        return
+    match_step = test.match_step
+
+    def traced_match_step(step):
+        with span('match step', 'planterbox', step=step):
+            return match_step(step)
+
+    test.match_step = traced_match_step
+    test._planterbox_traced = True
+
+
+def finish_span(test, attribute, name, category, **args):
+    """Record a span started by a 'before' hook, if there was one."""
+    start = getattr(test, attribute, None)
+    if start is None or _tracer is None:
+        return
+    setattr(test, attribute, None)
+    _tracer.record(name, category, start, time.time() - start, args)
+
+
+@hook('before', 'feature')
+def trace_feature_start(test):
+    start_tracing(int(config_option(test, 'trace.buffer-size',
+                                    DEFAULT_BUFFER_SIZE)))
+    instrument_match_step(test)
+    test.trace_feature_started = time.time()
+
+
+@hook('after', 'feature')
+def trace_feature_stop(test):
+    finish_span(test, 'trace_feature_started', test.feature_path, 'feature')
+    if _tracer is not None:
+        _tracer.save(worker_path(
+            config_option(test, 'trace.output', DEFAULT_OUTPUT)))
+
+
+@hook('before', 'scenario')
+def trace_scenario_start(test):
+    test.trace_scenario_started = time.time()
+
+
+@hook('after', 'scenario')
+@hook('after', 'failure')
+@hook('after', 'error')
+def trace_scenario_stop(test):
+    finish_span(test, 'trace_step_started', test.step, 'step',
+                scenario=test.scenario_name, finished=False)
+    finish_span(test, 'trace_scenario_started', test.scenario_name,
+                'scenario')
+
+
+@hook('before', 'step')
+def trace_step_start(test):
+    browser = getattr(test, 'browser', None)
+    if browser is not None:
+        instrument(browser)
+    test.trace_step_started = time.time()
+
+
+@hook('after', 'step')
+def trace_step_stop(test):
+    finish_span(test, 'trace_step_started', test.step, 'step',
+                scenario=test.scenario_name)
@@ -1,16 +1,25 @@
 """Utility functions that combine steps to locate elements"""
 
-import operator
-from six import (
-    text_type,
-)
-from six.moves import (
-    reduce,
-)
+from collections import namedtuple
 from time import time, sleep
-
-from selenium.common.exceptions import NoSuchElementException
+from weakref import WeakKeyDictionary, WeakSet
+
+from selenium.common.exceptions import (
+    JavascriptException,
+    NoSuchElementException,
+    TimeoutException,
+    UnknownMethodException,
+    WebDriverException,
+)
 from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.remote.webelement import WebElement
+
+from .config import config_option
+from .tracing import span
+
+import logging
+log = logging.getLogger(__name__)
 
 # pylint:disable=missing-docstring,redefined-outer-name,redefined-builtin
 # pylint:disable=invalid-name
@@ -22,29 +31,36 @@ class XPathSelector(object):
 
     Delays evaluation to batch the queries together, allowing operations on
     selectors (e.g. union) to be performed first, and then issuing as few
-    requests to the browser as possible.
+    requests to the browser as possible. Several pending selectors can be
+    evaluated in one request with evaluate_selectors.
 
     Also behaves as a single element by proxying all method calls, asserting
     that there is only one element selected.
     """
 
-    def __init__(self, browser, xpath=None, elements=None):
+    __slots__ = ('browser', 'xpath', 'context', '_elements_cached')
+
+    def __init__(self, browser, xpath=None, elements=None, context=None):
         """
         Initialise the selector.
 
         One of 'xpath' and 'elements' must be passed. Passing 'xpath' creates a
         selector delaying evaluation until it's needed, passing 'elements'
-        stores the elements immediately.
+        stores the elements immediately. A delayed selector may be relative to
+        a 'context': an element, or the first element of another selector.
         """
-        self.browser = browser
-
         if xpath is None and elements is None:
             raise ValueError("Must supply either xpath or elements.")
 
-        if xpath is not None:
-            self.xpath = xpath
-        else:
-            self._elements_cached = elements
+        self.browser = browser
+        self.xpath = xpath
+        self.context = context
+        self._elements_cached = None if xpath is not None else elements
+
+    @property
+    def pending(self):
+        """Whether the elements still have to be fetched from the browser."""
+        return self._elements_cached is None
 
     def _select(self):
         """
@@ -56,8 +72,11 @@ class XPathSelector(object):
         """
         The cached list of elements.
         """
-        if not hasattr(self, '_elements_cached'):
-            setattr(self, '_elements_cached', list(self._select()))
+        if self._elements_cached is None:
+            if self.context is None:
+                self._elements_cached = list(self._select())
+            else:
+                evaluate_selectors([self])
         return self._elements_cached
 
     def __add__(self, other):
@@ -67,12 +86,14 @@ class XPathSelector(object):
         Where possible, avoid evaluating either selector to batch queries.
         """
 
-        if not hasattr(self, '_elements_cached') \
+        if self.pending \
                 and isinstance(other, XPathSelector) \
-                and not hasattr(other, '_elements_cached'):
+                and other.pending \
+                and self.context is other.context:
             # Both summands are delayed, return a new delayed selector
             return XPathSelector(self.browser,
-                                 xpath=self.xpath + '|' + other.xpath)
+                                 xpath=self.xpath + '|' + other.xpath,
+                                 context=self.context)
         else:
             # Have to evaluate everything now
             # other can be either an already evaluated XPathSelector, a list or
@@ -100,27 +121,117 @@ class XPathSelector(object):
     def __nonzero__(self):
         return bool(self._elements())
 
+    __bool__ = __nonzero__
+
     def __getattr__(self, attr):
         """
         Delegate all calls to the only element selected.
         """
 
-        if attr == '_elements_cached':
-            # Never going to be on the element
-            raise AttributeError()
-
         assert len(self) == 1, \
             'Must be a single element, have {0}'.format(len(self))
         return getattr(self[0], attr)
 
 
+# Evaluates each XPath in turn, relative to the document, an element or the
+# first element found by an earlier XPath in the batch. Attributes are
+# returned as their values.
+EVALUATE_XPATHS_SCRIPT = u"""
+var results = [];
+arguments[0].forEach(function (spec) {
+    var context = spec.context !== null ? results[spec.context][0] :
+        spec.scoped ? spec.element : document;
+    var elements = [];
+    if (context) {
+        var found = document.evaluate(spec.xpath, context, null,
+            XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        for (var i = 0; i < found.snapshotLength; i++) {
+            var node = found.snapshotItem(i);
+            if (node.nodeType === Node.ELEMENT_NODE) {
+                elements.push(node);
+            } else if (node.nodeType === Node.ATTRIBUTE_NODE) {
+                elements.push(node.value);
+            }
+        }
+    }
+    results.push(elements);
+});
+return results;
+"""
+
+
+def evaluate_selectors(selectors):
+    """
+    Fetch the elements of several pending selectors with one browser command.
+
+    Selectors relative to another pending selector are evaluated against its
+    first element, in the same command; their context is included in the
+    batch if it isn't already. Selectors that are already evaluated are left
+    alone.
+    """
+    batch = []
+    indexes = {}
+
+    def add(selector):
+        if not selector.pending or id(selector) in indexes:
+            return
+        if isinstance(selector.context, XPathSelector):
+            add(selector.context)
+        indexes[id(selector)] = len(batch)
+        batch.append(selector)
+
+    for selector in selectors:
+        add(selector)
+    if not batch:
+        return
+
+    driver = None
+    specs = []
+    for selector in batch:
+        selector_driver, element = _driver_and_root(selector.browser)
+        driver = driver or selector_driver
+        context = None
+        if isinstance(selector.context, XPathSelector):
+            if selector.context.pending:
+                context = indexes[id(selector.context)]
+            else:
+                element = selector.context[0] if selector.context else None
+        elif selector.context is not None:
+            element = selector.context
+        specs.append({
+            'xpath': selector.xpath,
+            'context': context,
+            'element': element,
+            # An empty context selects nothing, rather than the document.
+            'scoped': element is not None or selector.context is not None,
+        })
+
+    results = driver.execute_script(EVALUATE_XPATHS_SCRIPT, specs)
+    for selector, elements in zip(batch, results):
+        selector._elements_cached = elements
+
+
+def xpath_literal(value):
+    """Quote a string for use in an XPath expression."""
+    if '"' not in value:
+        return u'"{0}"'.format(value)
+    if "'" not in value:
+        return u"'{0}'".format(value)
+    return u'concat({0})'.format(u', \'"\', '.join(
+        u'"{0}"'.format(part) for part in value.split('"')))
+
+
 def element_id_by_label(browser, label):
     """Return the id of a label's for attribute"""
-    label = XPathSelector(browser,
-                          str('//label[contains(., "%s")]' % label))
+    label = XPathSelector(browser, u'//label[contains(., {0})]'.format(
+        xpath_literal(label)))
+    target = XPathSelector(browser, '@for', context=label)
+    evaluate_selectors([label, target])
     if not label:
         return False
-    return label.get_attribute('for')
+    assert len(label) == 1, \
+        'Must be a single element, have {0}'.format(len(label))
+    return target[0] if target else None
 
 
 # Field helper functions to locate select, textarea, and the other
@@ -143,33 +254,351 @@ def field_xpath(field, attribute, escape=True):
         return './/input[@%s=%s][@type="%s"]' % (attribute, value, field)
 
 
+BUTTON_FIELDS = (
+    'submit',
+    'reset',
+    'button',
+    'image',
+)
+
+
+def _find_with_value(browser, fields, value):
+    driver, root = _driver_and_root(browser)
+    return driver.execute_script(
+        IS_DISPLAYED_SCRIPT + FIND_WITH_VALUE_SCRIPT,
+        list(fields), value, root,
+    )
+
+
 def find_button(browser, value):
-    return find_field_with_value(browser, 'submit', value) + \
-        find_field_with_value(browser, 'reset', value) + \
-        find_field_with_value(browser, 'button', value) + \
-        find_field_with_value(browser, 'image', value)
+    return find_fields_with_value(browser, BUTTON_FIELDS, value)
+
+
+def find_fields_with_value(browser, fields, value):
+    """
+    Find fields of each type by id, name or value with one browser command.
+
+    Gives the same elements in the same order as adding together
+    find_field_with_value for each of the field types.
+    """
+    elements = []
+    for matches in _find_with_value(browser, fields, value):
+        elements.extend(matches['byIdOrName'])
+        if matches['byValue'] is not None:
+            elements.append(matches['byValue'])
+    return XPathSelector(browser, elements=elements)
 
 
 def find_field_with_value(browser, field, value):
-    return find_field_by_id(browser, field, value) + \
-        find_field_by_name(browser, field, value) + \
-        find_field_by_value(browser, field, value)
+    return find_fields_with_value(browser, (field,), value)
+
+
+def field_selectors(browser, field, value, context=None):
+    """
+    Selectors for a field by id, name and label, in order of precedence.
+    """
+    literal = xpath_literal(value)
+    return [
+        XPathSelector(browser,
+                      field_xpath(field, 'id', escape=False) % literal,
+                      context=context),
+        XPathSelector(browser,
+                      field_xpath(field, 'name', escape=False) % literal,
+                      context=context),
+        XPathSelector(browser,
+                      field_xpath(field, 'id', escape=False) %
+                      u'//label[contains(., {0})]/@for'.format(literal),
+                      context=context),
+    ]
+
+
+def _find_in_select(browser, select_name, option_selectors):
+    """
+    Locate a select, as find_field would, and an option within it.
+
+    'option_selectors' gives the selectors for the option relative to a
+    select, in order of preference. They're evaluated against the select
+    found by id, by name and by label, all in one browser command. Returns the
+    select and the first option selector to match, or None for either.
+
+    Like find_field, the lookups together must match at most one select.
+    """
+    selects = field_selectors(browser, 'select', select_name)
+    options = [option_selectors(select) for select in selects]
+    evaluate_selectors(selects + [option for candidates in options
+                                  for option in candidates])
+    matched = []
+    for select in selects:
+        for element in select:
+            if element not in matched:
+                matched.append(element)
+    assert len(matched) <= 1, \
+        'Must be a single element, have {0}'.format(len(matched))
+    for select, candidates in zip(selects, options):
+        if select:
+            for option in candidates:
+                if option:
+                    return select, option
+            return select, None
+    return None, None
 
 
 def find_option(browser, select_name, option_name):
-    # First, locate the select
-    select_box = find_field(browser, 'select', select_name)
+    by_contents = []
+
+    def option_selectors(select):
+        by_contents.append(XPathSelector(
+            browser,
+            u'.//option[contains(., {0})]'.format(xpath_literal(option_name)),
+            context=select,
+        ))
+        return field_selectors(browser, 'option', option_name,
+                               context=select) + by_contents[-1:]
+
+    select_box, option_box = _find_in_select(browser, select_name,
+                                             option_selectors)
     assert select_box
 
-    # Now locate the option
-    option_box = find_field(select_box, 'option', option_name)
-    if not option_box:
-        # Locate by contents
-        option_box = select_box.find_element(By.XPATH, str(
-            './/option[contains(., "%s")]' % option_name))
+    if option_box is None:
+        raise NoSuchElementException(
+            u'No option "{0}" in "{1}"'.format(option_name, select_name))
+    if any(option_box is selector for selector in by_contents):
+        # Located by contents, which may match several options
+        return option_box[0]
     return option_box
 
 
+# An approximation of WebDriver's displayedness check, for scripts that need
+# to filter on visibility without a command per element.
+IS_DISPLAYED_SCRIPT = u"""
+function isDisplayed(el) {
+    if (el.tagName.toLowerCase() === 'option') {
+        el = el.closest('select') || el;
+    }
+    var style = window.getComputedStyle(el);
+    if (style.visibility === 'hidden' || style.visibility === 'collapse') {
+        return false;
+    }
+    return el.getClientRects().length > 0;
+}
+"""
+
+# Mirrors field_xpath: select, textarea, button and option are matched by
+# tag, everything else is an <input> with that exact type attribute.
+FIELD_TYPE_SCRIPT = u"""
+var TAG_FIELDS = ['select', 'textarea', 'button', 'option'];
+
+function fieldType(el) {
+    var tag = el.tagName.toLowerCase();
+    return TAG_FIELDS.indexOf(tag) !== -1 ?
+        tag : 'input:' + el.getAttribute('type');
+}
+
+function fieldsOfType(root, types) {
+    var wanted = types.map(function (type) {
+        return TAG_FIELDS.indexOf(type) !== -1 ? type : 'input:' + type;
+    });
+    return Array.prototype.filter.call(
+        root.querySelectorAll('input, select, textarea, button, option'),
+        function (el) { return wanted.indexOf(fieldType(el)) !== -1; });
+}
+"""
+
+# Keeps lookups of the whole document until the DOM next changes. Only which
+# elements match is cached: anything that can change without a DOM mutation,
+# such as an input's current value or its visibility, is read afresh.
+# A new document (navigation) starts with an empty cache. Only the attributes
+# lookups match on invalidate it, so e.g. toggling classes doesn't.
+LOOKUP_CACHE_SCRIPT = u"""
+function cachedLookup(root, key, compute) {
+    if (root !== document) {
+        return compute();
+    }
+    var cache = window.__planterboxLookups;
+    if (!cache || cache.document !== document) {
+        cache = window.__planterboxLookups = {
+            document: document,
+            entries: Object.create(null)
+        };
+        cache.observer = new MutationObserver(function () {
+            cache.entries = Object.create(null);
+        });
+        cache.observer.observe(document, {
+            childList: true,
+            subtree: true,
+            attributes: true,
+            attributeFilter: ['id', 'name', 'for', 'type', 'value'],
+            characterData: true
+        });
+    }
+    // Changes since the observer's callback last ran.
+    if (cache.observer.takeRecords().length) {
+        cache.entries = Object.create(null);
+    }
+    key = JSON.stringify(key);
+    if (!(key in cache.entries)) {
+        cache.entries[key] = compute();
+    }
+    return cache.entries[key];
+}
+"""
+
+FIND_FIELD_SCRIPT = LOOKUP_CACHE_SCRIPT + FIELD_TYPE_SCRIPT + u"""
+var groups = arguments[0], value = arguments[1];
+var root = arguments[2] || document;
+
+var labelled = null;
+function labelTargets() {
+    if (labelled === null) {
+        labelled = Object.create(null);
+        var labels = document.getElementsByTagName('label');
+        for (var i = 0; i < labels.length; i++) {
+            var target = labels[i].getAttribute('for');
+            if (target !== null && labels[i].textContent.indexOf(value) !== -1) {
+                labelled[target] = true;
+            }
+        }
+    }
+    return labelled;
+}
+
+var precedence = [
+    function (el) { return el.getAttribute('id') === value; },
+    function (el) { return el.getAttribute('name') === value; },
+    function (el) {
+        var id = el.getAttribute('id');
+        return id !== null && labelTargets()[id] === true;
+    }
+];
+
+function findInGroup(types) {
+    return cachedLookup(root, ['field', types, value], function () {
+        var candidates = fieldsOfType(root, types);
+        for (var p = 0; p < precedence.length; p++) {
+            var matches = candidates.filter(precedence[p]);
+            if (matches.length) {
+                return matches;
+            }
+        }
+        return [];
+    });
+}
+
+// Each group of types is only searched if the ones before it found nothing.
+var matches = [];
+for (var g = 0; g < groups.length && !matches.length; g++) {
+    matches = findInGroup(groups[g]);
+}
+if (!matches.length) {
+    return null;
+}
+var el = matches[0];
+return {
+    elements: matches,
+    type: fieldType(el).replace(/^input:/, ''),
+    value: el.value,
+    displayed: isDisplayed(el),
+    enabled: !el.matches(':disabled')
+};
+"""
+
+# The batched equivalent of find_field_with_value for each field type in turn:
+# id and name matches in document order, then the shortest displayed and
+# enabled match by value.
+FIND_WITH_VALUE_SCRIPT = LOOKUP_CACHE_SCRIPT + FIELD_TYPE_SCRIPT + u"""
+var types = arguments[0], value = arguments[1];
+var root = arguments[2] || document;
+
+function valueLength(el) {
+    return (el.tagName.toLowerCase() === 'button' ?
+        el.innerText.trim() : (el.value || '')).length;
+}
+
+return types.map(function (type) {
+    var found = cachedLookup(root, ['value', type, value], function () {
+        var candidates = fieldsOfType(root, [type]);
+        return {
+            byIdOrName: candidates.filter(function (el) {
+                return el.getAttribute('id') === value ||
+                    el.getAttribute('name') === value;
+            }),
+            byValue: candidates.filter(function (el) {
+                if (type === 'button') {
+                    return el.textContent.indexOf(value) !== -1;
+                }
+                return el.getAttribute('value') === value;
+            })
+        };
+    });
+    var byValue = found.byValue.filter(function (el) {
+        return isDisplayed(el) && !el.matches(':disabled');
+    }).map(function (el, index) {
+        return {el: el, index: index, length: valueLength(el)};
+    }).sort(function (a, b) {
+        return a.length - b.length || a.index - b.index;
+    });
+    return {
+        byIdOrName: found.byIdOrName,
+        byValue: byValue.length ? byValue[0].el : null
+    };
+});
+"""
+
+
+FieldMatch = namedtuple('FieldMatch', [
+    'element', 'type', 'value', 'displayed', 'enabled', 'count',
+])
+
+
+def _driver_and_root(browser):
+    """
+    Split a search context into the driver and the element to search under.
+
+    The search context may be a driver, an element or a selector that must
+    resolve to a single element.
+    """
+    if isinstance(browser, XPathSelector):
+        assert len(browser) == 1, \
+            'Must be a single element, have {0}'.format(len(browser))
+        browser = browser[0]
+    if isinstance(browser, WebElement):
+        return browser.parent, browser
+    return browser, None
+
+
+def _resolve_fields(browser, type_groups, value):
+    driver, root = _driver_and_root(browser)
+    return driver.execute_script(
+        IS_DISPLAYED_SCRIPT + FIND_FIELD_SCRIPT,
+        [list(field_types) for field_types in type_groups], value, root,
+    )
+
+
+def resolve_field(browser, type_groups, value):
+    """
+    Locate a field of any of the specified types with one browser command.
+
+    'type_groups' is a sequence of field type lists, searched in turn until
+    one of them matches, so e.g. date fields can take precedence over text
+    fields.
+
+    Returns a FieldMatch carrying the first element found and its type, value,
+    visibility and enabled state, or None if nothing matched. 'count' is the
+    number of elements that matched at the same precedence.
+    """
+    match = _resolve_fields(browser, type_groups, value)
+    if not match:
+        return None
+    return FieldMatch(
+        element=match['elements'][0],
+        type=match['type'],
+        value=match['value'],
+        displayed=match['displayed'],
+        enabled=match['enabled'],
+        count=len(match['elements']),
+    )
+
+
 def find_field(browser, field, value):
     """Locate an input field of a given value
 
@@ -177,21 +606,20 @@ def find_field(browser, field, value):
     the name of the element, then a label for the element.
 
     """
-    return find_field_by_id(browser, field, value) + \
-        find_field_by_name(browser, field, value) + \
-        find_field_by_label(browser, field, value)
+    return find_any_field(browser, (field,), value)
 
 
 def find_any_field(browser, field_types, field_name):
     """
     Find a field of any of the specified types.
+
+    The id, name and label precedence is resolved in the browser, so this
+    costs a single command however many field types are searched.
     """
 
-    return reduce(
-        operator.add,
-        (find_field(browser, field_type, field_name)
-         for field_type in field_types)
-    )
+    match = _resolve_fields(browser, (field_types,), field_name)
+    return XPathSelector(browser,
+                         elements=match['elements'] if match else [])
 
 
 def find_field_by_id(browser, field, id):
@@ -203,20 +631,10 @@ def find_field_by_name(browser, field, name):
 
 
 def find_field_by_value(browser, field, name):
-    xpath = field_xpath(field, 'value')
-    elems = [elem for elem in XPathSelector(browser, text_type(xpath % name))
-             if elem.is_displayed() and elem.is_enabled()]
-
-    # sort by shortest first (most closely matching)
-    if field == 'button':
-        elems = sorted(elems, key=lambda elem: len(elem.text))
-    else:
-        elems = sorted(elems,
-                       key=lambda elem: len(elem.get_attribute('value')))
-
-    if elems:
-        elems = [elems[0]]
-    return elems
+    # Visibility filtering and sorting by shortest first (most closely
+    # matching) happen in the browser.
+    match = _find_with_value(browser, (field,), name)[0]['byValue']
+    return [match] if match is not None else []
 
 
 def find_field_by_label(browser, field, label):
@@ -241,14 +659,207 @@ def option_in_select(browser, select_name, option):
     create the DOM until we click on it.
     """
 
-    select = find_field(browser, 'select', select_name)
+    select, option = _find_in_select(
+        browser, select_name,
+        lambda select: [XPathSelector(
+            browser,
+            u'.//option[normalize-space(text()) = {0}]'.format(
+                xpath_literal(option)),
+            context=select,
+        )],
+    )
     assert select
 
-    try:
-        return select.find_element(By.XPATH, text_type(
-            './/option[normalize-space(text()) = "%s"]' % option))
-    except NoSuchElementException:
-        return None
+    return option[0] if option else None
+
+
+# XPath's normalize-space(), which Select's visible text matching uses.
+NORMALIZE_SPACE_SCRIPT = u"""
+function normalizeSpace(text) {
+    return text.replace(/[ \\t\\r\\n]+/g, ' ').replace(/^ | $/g, '');
+}
+"""
+
+# Does what Select's deselect_all and then select_by_value, falling back to
+# select_by_visible_text, for each name would, and fires input and change
+# once if the selection changed.
+SET_MULTI_SELECTION_SCRIPT = NORMALIZE_SPACE_SCRIPT + u"""
+var select = arguments[0], names = arguments[1];
+if (!select.multiple) {
+    return {error: 'multiple'};
+}
+var options = Array.prototype.slice.call(select.querySelectorAll('option'));
+var chosen = options.map(function () { return false; });
+
+for (var n = 0; n < names.length; n++) {
+    var byValue = options.filter(function (option) {
+        return option.getAttribute('value') === names[n];
+    });
+    var matched = byValue.length ? byValue : options.filter(function (option) {
+        return normalizeSpace(option.textContent) === names[n];
+    });
+    if (!matched.length) {
+        return {error: 'missing', name: names[n]};
+    }
+    for (var m = 0; m < matched.length; m++) {
+        if (matched[m].disabled && !matched[m].selected) {
+            return {error: 'disabled', name: names[n]};
+        }
+        chosen[options.indexOf(matched[m])] = true;
+    }
+}
+
+var changed = false;
+options.forEach(function (option, i) {
+    if (option.selected !== chosen[i]) {
+        option.selected = chosen[i];
+        changed = true;
+    }
+});
+if (changed) {
+    select.dispatchEvent(new Event('input', {bubbles: true}));
+    select.dispatchEvent(new Event('change', {bubbles: true}));
+}
+return {error: null};
+"""
+
+# For each of the select's own options, whether it's selected and whether
+# its id, name, value or text is one of the names.
+MULTI_SELECTION_SCRIPT = NORMALIZE_SPACE_SCRIPT + u"""
+var select = arguments[0], names = arguments[1];
+return Array.prototype.filter.call(select.children, function (el) {
+    return el.tagName.toLowerCase() === 'option';
+}).map(function (option) {
+    var text = normalizeSpace(option.textContent);
+    return {
+        text: text,
+        named: [option.id, option.getAttribute('name'), option.value,
+                text].some(function (name) {
+            return names.indexOf(name) !== -1;
+        }),
+        selected: option.selected
+    };
+});
+"""
+
+
+def set_multi_selection(select, names):
+    """
+    Select exactly the options of a multiple select matching 'names'.
+
+    Each name matches options by value or, failing that, by visible text,
+    as Selenium's Select would, but in one browser command.
+    """
+    driver, select = _driver_and_root(select)
+    result = driver.execute_script(SET_MULTI_SELECTION_SCRIPT, select,
+                                   list(names))
+    if result['error'] == 'multiple':
+        raise NotImplementedError(
+            'You may only deselect all options of a multi-select')
+    if result['error'] == 'disabled':
+        raise NotImplementedError(
+            u'You may not select a disabled option: {0}'.format(
+                result['name']))
+    if result['error'] == 'missing':
+        raise NoSuchElementException(
+            u'Cannot locate option with value or visible text: {0}'.format(
+                result['name']))
+
+
+def multi_selection(select, names):
+    """
+    Read the state of each of a select's options with one browser command.
+
+    Returns a dict for each option with its 'text', whether it's 'named' by
+    id, name, value or text in 'names' and whether it's 'selected'.
+    """
+    driver, select = _driver_and_root(select)
+    return driver.execute_script(MULTI_SELECTION_SCRIPT, select, list(names))
+
+
+# How steps fill in fields: 'type' sends each character as a keystroke,
+# 'set' sets the value in one command where the field allows it.
+FILL_STRATEGIES = ('type', 'set')
+
+FILL_STRATEGY = 'type'
+
+# Fields that only behave when typed into, even with the 'set' strategy.
+KEYSTROKE_FIELDS = (
+    'input[type=date], input[type=datetime], input[type=datetime-local], '
+    '[data-mask], [data-inputmask]'
+)
+
+# Sets the value through the prototype's setter, which frameworks that wrap
+# an input's own value property (React, for example) still notice, then fires
+# the events typing would. Returns false, changing nothing, for fields that
+# have to be typed into.
+SET_VALUE_SCRIPT = u"""
+var el = arguments[0], value = arguments[1], keystrokeFields = arguments[2];
+var tag = el.tagName.toLowerCase();
+if ((tag !== 'input' && tag !== 'textarea') || el.readOnly || el.disabled ||
+        el.matches(keystrokeFields)) {
+    return false;
+}
+var proto = tag === 'textarea' ?
+    window.HTMLTextAreaElement.prototype : window.HTMLInputElement.prototype;
+// Typing stops at maxlength, which setting the value directly would skip.
+var limited = tag === 'textarea' || ['text', 'search', 'url', 'tel', 'email',
+    'password'].indexOf(el.type) !== -1;
+if (limited && el.maxLength >= 0) {
+    value = value.slice(0, el.maxLength);
+}
+var previous = el.value;
+el.focus();
+Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, value);
+if (el.value !== value) {
+    // Rejected by the field, e.g. text in a number input.
+    el.value = previous;
+    return false;
+}
+el.dispatchEvent(new Event('input', {bubbles: true}));
+el.dispatchEvent(new Event('change', {bubbles: true}));
+el.blur();
+return true;
+"""
+
+
+def fill_strategy(test):
+    """The 'fill.strategy' for this run, 'type' unless configured."""
+    strategy = config_option(test, 'fill.strategy', FILL_STRATEGY)
+    if strategy not in FILL_STRATEGIES:
+        raise ValueError(
+            'fill.strategy must be one of {0}, not {1!r}'.format(
+                ', '.join(FILL_STRATEGIES), strategy))
+    return strategy
+
+
+def set_value(element, value, keystroke_fields=KEYSTROKE_FIELDS):
+    """
+    Set a field's value in one command, firing input, change and blur.
+
+    Returns False, leaving the field alone, if it has to be typed into.
+    """
+    driver, element = _driver_and_root(element)
+    return driver.execute_script(SET_VALUE_SCRIPT, element, value,
+                                 keystroke_fields)
+
+
+def fill_in(test, element, value, strategy=None, date=False):
+    """
+    Replace a field's value using the step's or the run's fill strategy.
+
+    Typing clears the field first, or for 'date' fields, which can't be
+    cleared, sends a delete.
+    """
+    if (strategy or fill_strategy(test)) == 'set' and set_value(
+            element, value,
+            config_option(test, 'fill.keystroke-fields', KEYSTROKE_FIELDS)):
+        return
+    if date:
+        element.send_keys(Keys.DELETE)
+    else:
+        element.clear()
+    element.send_keys(value)
 
 
 def wait_for(func):
@@ -264,16 +875,235 @@ def wait_for(func):
         result = None
 
         while time() - start < timeout:
-            result = func(*args, **kwargs)
+            with span('poll', 'wait', function=func.__name__):
+                result = func(*args, **kwargs)
             if result:
                 break
-            sleep(0.2)
+            with span('sleep', 'wait'):
+                sleep(0.2)
 
         return result
 
     return wrapped
 
 
+# Conditions for wait_for_mutation. Each defines condition(arg), returning a
+# truthy value (or a non-empty list) once it is satisfied.
+XPATH_ELEMENTS_CONDITION = u"""
+function condition(xpath) {
+    var found = document.evaluate(xpath, document, null,
+        XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    var elements = [];
+    for (var i = 0; i < found.snapshotLength; i++) {
+        elements.push(found.snapshotItem(i));
+    }
+    return elements;
+}
+"""
+
+XPATH_VISIBLE_CONDITION = IS_DISPLAYED_SCRIPT + u"""
+function condition(xpath) {
+    var first = document.evaluate(xpath, document, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    return first !== null && isDisplayed(first);
+}
+"""
+
+# Finds the deepest displayed element whose normalize-space()d text contains
+# the content, descending only into elements that contain it.
+CONTENT_SEARCH_SCRIPT = IS_DISPLAYED_SCRIPT + u"""
+function containsContent(el, content) {
+    return el.textContent.replace(/[ \\t\\r\\n]+/g, ' ').trim()
+        .indexOf(content) !== -1;
+}
+
+function findContent(content) {
+    var root = document.documentElement;
+    if (root === null || !containsContent(root, content)) {
+        return null;
+    }
+    var stack = [root];
+    while (stack.length) {
+        var el = stack.pop(), containing = [];
+        for (var child = el.firstElementChild; child !== null;
+             child = child.nextElementSibling) {
+            if (containsContent(child, content)) {
+                containing.push(child);
+            }
+        }
+        if (!containing.length) {
+            if (isDisplayed(el)) {
+                return el;
+            }
+        } else {
+            // Visit in document order
+            stack.push.apply(stack, containing.reverse());
+        }
+    }
+    return null;
+}
+"""
+
+FIND_CONTENT_SCRIPT = CONTENT_SEARCH_SCRIPT + u"""
+return findContent(arguments[0]);
+"""
+
+CONTENT_VISIBLE_CONDITION = CONTENT_SEARCH_SCRIPT + u"""
+function condition(content) {
+    return findContent(content) !== null;
+}
+"""
+
+# Re-checks the condition whenever the DOM changes, with a slow backstop for
+# changes that aren't mutations (e.g. a stylesheet loading), and gives up
+# with the last result after the timeout.
+WAIT_FOR_MUTATION_SCRIPT = u"""
+var arg = arguments[0], timeout = arguments[1];
+var done = arguments[arguments.length - 1];
+var finished = false, observer = null, backstop = null, timer = null;
+
+function satisfied(result) {
+    return Array.isArray(result) ? result.length > 0 : !!result;
+}
+
+function finish(result) {
+    if (!finished) {
+        finished = true;
+        if (observer !== null) {
+            observer.disconnect();
+        }
+        clearInterval(backstop);
+        clearTimeout(timer);
+        done(result);
+    }
+}
+
+// Errors from the first check are reported to WebDriver; later ones (e.g.
+// from a document being torn down) just leave the last result standing.
+var last = condition(arg);
+function attempt() {
+    try {
+        last = condition(arg);
+    } catch (e) {
+        return;
+    }
+    if (satisfied(last)) {
+        finish(last);
+    }
+}
+
+if (satisfied(last)) {
+    finish(last);
+} else {
+    observer = new MutationObserver(attempt);
+    observer.observe(document, {
+        childList: true, subtree: true, attributes: true, characterData: true
+    });
+    backstop = setInterval(attempt, 1000);
+    timer = setTimeout(function () {
+        attempt();
+        finish(last);
+    }, timeout * 1000);
+}
+"""
+
+# Keep each asynchronous wait well inside WebDriver's default 30 second
+# script timeout; longer waits are issued as several scripts.
+MUTATION_WAIT_CHUNK = 10
+
+_mutation_wait_unsupported = WeakSet()
+
+
+def unsupported_command(exc):
+    """
+    Whether a WebDriver error means the driver doesn't have a command.
+
+    Unknown commands and unsupported operations have no more specific
+    exception than WebDriverException itself.
+    """
+    return (isinstance(exc, UnknownMethodException) or
+            type(exc) is WebDriverException)
+
+
+def wait_for_mutation(browser, condition, arg, timeout=15, fallback=None):
+    """
+    Wait inside the browser for a condition script to be satisfied.
+
+    The condition is re-checked by a MutationObserver whenever the DOM
+    changes, so this returns as soon as it holds without polling over
+    WebDriver. If the browser can't run the asynchronous script, or the page
+    navigates away mid-wait, 'fallback' is called with the remaining
+    'timeout' to poll instead. Other errors, such as a closed window, are
+    raised.
+    """
+    start = time()
+    result = None
+
+    if browser not in _mutation_wait_unsupported:
+        try:
+            while time() - start < timeout:
+                result = browser.execute_async_script(
+                    condition + WAIT_FOR_MUTATION_SCRIPT,
+                    arg,
+                    min(MUTATION_WAIT_CHUNK, timeout - (time() - start)),
+                )
+                if result:
+                    return result
+            return result
+        except (JavascriptException, TimeoutException):
+            # The page navigated away mid-wait, or the script outlived the
+            # script timeout: poll for the rest of this wait.
+            pass
+        except WebDriverException as exc:
+            if not unsupported_command(exc):
+                raise
+            _mutation_wait_unsupported.add(browser)
+
+    remaining = timeout - (time() - start)
+    if fallback is None or remaining <= 0:
+        return result
+    return fallback(timeout=remaining)
+
+
+# Scripts preloaded for each driver, by name, and drivers that can't have
+# preload scripts. Both forget a driver once it's gone.
+_preloaded_scripts = WeakKeyDictionary()
+_unpreloadable_drivers = WeakSet()
+
+
+def preload_script(browser, name, source):
+    """
+    Have the browser evaluate a script on every new document.
+
+    Uses a CDP or WebDriver BiDi preload script where the driver supports one,
+    adding each 'name' once per session. 'source' may be a callable, only
+    called if the script needs adding. Returns whether the script is
+    preloaded for this session.
+    """
+    preloaded = _preloaded_scripts.setdefault(browser, set())
+    if name in preloaded:
+        return True
+    if browser in _unpreloadable_drivers:
+        return False
+
+    if callable(source):
+        source = source()
+    try:
+        if hasattr(browser, 'execute_cdp_cmd'):
+            browser.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument',
+                                    {'source': source})
+        else:
+            browser.script.add_preload_script(
+                u'() => {{\n{}\n}}'.format(source))
+    except (AttributeError, WebDriverException):
+        log.debug('No preload scripts for session %s', browser.session_id)
+        _unpreloadable_drivers.add(browser)
+        return False
+
+    preloaded.add(name)
+    return True
+
+
 def submit_form(element):
     """Form submission work-around
 
@@ -1,71 +1,103 @@
 """Webdriver support for lettuce"""
 
+from functools import partial
 from importlib import import_module
 
-from six import (
-    text_type,
-)
-
 from planterbox import step
 
+from planterbox_webdriver.readiness import (
+    readiness_timeout,
+    wait_until_idle,
+)
+from planterbox_webdriver.session import (
+    prepare_state,
+    remember_origin,
+)
 from planterbox_webdriver.util import (
-    find_any_field,
     find_button,
     find_field,
+    fill_in,
     find_option,
+    multi_selection,
     option_in_select,
+    resolve_field,
+    set_multi_selection,
     submit_form,
     wait_for,
+    wait_for_mutation,
+    CONTENT_VISIBLE_CONDITION,
+    FIND_CONTENT_SCRIPT,
+    XPATH_ELEMENTS_CONDITION,
+    XPATH_VISIBLE_CONDITION,
 )
 
-from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.alert import Alert
-from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import (
     NoSuchElementException,
-    StaleElementReferenceException,
     NoAlertPresentException,
     WebDriverException)
 
 # pylint:disable=missing-docstring,redefined-outer-name
 
 
-def contains_content(browser, content):
-    # Search for an element that contains the whole of the text we're looking
-    #  for in it or its subelements, but whose children do NOT contain that
-    #  text - otherwise matches <body> or <html> or other similarly useless
-    #  things.
-    for elem in browser.find_elements(By.XPATH, text_type(
-        u'//*[contains(normalize-space(.),"{content}") '
-        u'and not(./*[contains(normalize-space(.),"{content}")])]'.format(
-            content=content))):
+def find_content(browser, content):
+    """
+    Find the deepest visible element containing some text, or None.
 
-        try:
-            if elem.is_displayed():
-                return True
-        except StaleElementReferenceException:
-            pass
+    Like the XPath '//*[contains(normalize-space(.), ...)]' but excluding
+    elements with a child that also contains the text, which would otherwise
+    match <body>, <html> and other similarly useless things. The search runs
+    in the browser, so it costs one command.
+    """
+    return browser.execute_script(FIND_CONTENT_SCRIPT, content)
 
-    return False
+
+def contains_content(browser, content):
+    return find_content(browser, content) is not None
 
 
 @wait_for
-def wait_for_elem(browser, xpath):
+def poll_for_elem(browser, xpath):
     return browser.find_elements(By.XPATH, str(xpath))
 
 
+def wait_for_elem(browser, xpath, timeout=15):
+    return wait_for_mutation(browser, XPATH_ELEMENTS_CONDITION, str(xpath),
+                             timeout=timeout,
+                             fallback=partial(poll_for_elem, browser, xpath))
+
+
 @wait_for
-def wait_for_content(browser, content):
+def poll_for_content(browser, content):
     return contains_content(browser, content)
 
 
-def lookup_url(test, url):
+def wait_for_content(browser, content, timeout=15):
+    return wait_for_mutation(browser, CONTENT_VISIBLE_CONDITION, content,
+                             timeout=timeout,
+                             fallback=partial(poll_for_content,
+                                              browser, content))
+
+
+# Each test module's PAGES, so they're only looked up once.
+_module_pages = {}
+
+
+def module_pages(test):
+    """The PAGES of a test, or else of the module defining it."""
     if hasattr(test, 'PAGES'):
-        return getattr(test, 'PAGES', {}).get(url, url)
-    else:
-        module = import_module(test.__module__)
-        return getattr(module, 'PAGES', {}).get(url, url)
+        return test.PAGES
+    try:
+        return _module_pages[test.__module__]
+    except KeyError:
+        pages = getattr(import_module(test.__module__), 'PAGES', {})
+        _module_pages[test.__module__] = pages
+        return pages
+
+
+def lookup_url(test, url):
+    return module_pages(test).get(url, url)
 
 
 # URLS
@@ -73,6 +105,7 @@ def lookup_url(test, url):
 @step('I go to "(.*?)"$')
 def visit(test, url):
     url = lookup_url(test, url)
+    remember_origin(test.browser, url)
     test.browser.get(url)
 
 
@@ -126,13 +159,20 @@ def element_not_contains(test, element_id, value):
 
 
 @wait_for
-def wait_for_visible_elem(browser, xpath):
+def poll_for_visible_elem(browser, xpath):
     elem = browser.find_elements(By.XPATH, str(xpath))
     if not elem:
         return False
     return elem[0].is_displayed()
 
 
+def wait_for_visible_elem(browser, xpath, timeout=15):
+    return wait_for_mutation(browser, XPATH_VISIBLE_CONDITION, str(xpath),
+                             timeout=timeout,
+                             fallback=partial(poll_for_visible_elem,
+                                              browser, xpath))
+
+
 @step(r'I should see an element with id of "(.*?)" within (\d+) seconds?$')
 def should_see_id_in_seconds(test, element_id, timeout):
     elem = wait_for_visible_elem(test.browser,
@@ -201,6 +241,15 @@ def url_should_not_contain(test, url):
     test.assertNotIn(url, test.browser.current_url)
 
 
+@step(r'The browser is in the "([^"]*?)" state after:?', multiline=True)
+def browser_in_state(test, name, steps):
+    """
+    Run the setup steps the first time, and restore their cookies and
+    storage after that.
+    """
+    prepare_state(test, name, steps)
+
+
 # Forms
 @step('I should see a form that goes to "(.*?)"$')
 def see_form(test, url):
@@ -232,24 +281,31 @@ TEXT_FIELDS = (
 )
 
 
+def assert_single_field(test, field, field_name):
+    test.assertTrue(field, u'Can not find a field named "%s"' % field_name)
+    test.assertEqual(field.count, 1,
+                     u'Found %d fields named "%s"' % (field.count, field_name))
+
+
 @step('I fill in "(.*?)" with "(.*?)"$')
-def fill_in_textfield(test, field_name, value):
-    date_field = find_any_field(test.browser,
-                                DATE_FIELDS,
-                                field_name)
-    if date_field:
-        field = date_field
-    else:
-        field = find_any_field(test.browser,
-                               TEXT_FIELDS,
-                               field_name)
+def fill_in_textfield(test, field_name, value, strategy=None):
+    field = resolve_field(test.browser,
+                          (DATE_FIELDS, TEXT_FIELDS),
+                          field_name)
 
-    test.assertTrue(field, 'Can not find a field named "%s"' % field_name)
-    if date_field:
-        field.send_keys(Keys.DELETE)
-    else:
-        field.clear()
-    field.send_keys(value)
+    assert_single_field(test, field, field_name)
+    fill_in(test, field.element, value, strategy=strategy,
+            date=field.type in DATE_FIELDS)
+
+
+@step('I set "(.*?)" to "(.*?)"$')
+def set_textfield(test, field_name, value):
+    fill_in_textfield(test, field_name, value, strategy='set')
+
+
+@step('I type "(.*?)" into "(.*?)"$')
+def type_into_textfield(test, value, field_name):
+    fill_in_textfield(test, field_name, value, strategy='type')
 
 
 @step('I press "(.*?)"$')
@@ -307,12 +363,11 @@ def input_has_value(test, field_name, value):
     """
     Check that the form input element has given value.
     """
-    text_field = find_any_field(test.browser,
-                                DATE_FIELDS + TEXT_FIELDS,
-                                field_name)
-    test.assertTrue(text_field,
-                    u'Can not find a field named "%s"' % field_name)
-    test.assertEqual(text_field.get_attribute('value'), value)
+    text_field = resolve_field(test.browser,
+                               (DATE_FIELDS + TEXT_FIELDS,),
+                               field_name)
+    assert_single_field(test, text_field, field_name)
+    test.assertEqual(text_field.value, value)
 
 
 @step(r'I submit the only form')
@@ -386,15 +441,7 @@ def select_multi_items(test, select_name, option_names):
     option_names = [on.strip() for on
                     in option_names.split('\n') if on.strip()]
     select_box = find_field(test.browser, 'select', select_name)
-
-    select = Select(select_box)
-    select.deselect_all()
-
-    for option in option_names:
-        try:
-            select.select_by_value(option)
-        except NoSuchElementException:
-            select.select_by_visible_text(option)
+    set_multi_selection(select_box, option_names)
 
 
 @step('The "(.*?)" option from "(.*?)" should be selected$')
@@ -410,15 +457,13 @@ def assert_multi_selected(test, select_name, option_names):
     option_names = [on.strip() for on
                     in option_names.split('\n') if on.strip()]
     select_box = find_field(test.browser, 'select', select_name)
-    option_elems = select_box.find_elements(By.XPATH, str('./option'))
-    for option in option_elems:
-        if option.get_attribute('id') in option_names or \
-           option.get_attribute('name') in option_names or \
-           option.get_attribute('value') in option_names or \
-           option.text in option_names:
-            test.assertTrue(option.is_selected())
+    for option in multi_selection(select_box, option_names):
+        if option['named']:
+            test.assertTrue(option['selected'],
+                            u'"{}" is not selected'.format(option['text']))
         else:
-            test.assertFalse(option.is_selected())
+            test.assertFalse(option['selected'],
+                             u'"{}" is selected'.format(option['text']))
 
 
 @step(r'I should see option "([^"]*)" in selector "([^"]*)"')
@@ -562,6 +607,21 @@ def page_title(test, title):
     test.assertEqual(test.browser.title, title)
 
 
+@step(r'I wait for the page to be idle$')
+def wait_for_idle(test):
+    """
+    Wait for the page to finish loading, animating and making requests.
+    """
+    page_should_be_idle(test, readiness_timeout(test))
+
+
+@step(r'The page should be idle within (\d+) seconds?$')
+def page_should_be_idle(test, timeout):
+    busy = wait_until_idle(test.browser, timeout=float(timeout))
+    test.assertFalse(busy, 'The page is still busy: {}'.format(
+        ', '.join(busy)))
+
+
 @step(r'I switch to the frame with id "([^"]*)"')
 def switch_to_frame(test, frame):
     elem = test.browser.find_element_by_id(frame)